@@ -0,0 +1,269 @@
+"""Admission control: bounded concurrency and load shedding for the API.
+
+Plain `def` routes (list_posts, get_post, list_categories, route/banner.py,
+...) run on AnyIO's worker threads, and every one of them holds a database
+connection. Without a limit, a load spike turns into an unbounded backlog:
+requests wait for a thread, then for a pooled connection (up to
+DB_POOL_TIMEOUT), latency climbs for everyone and clients time out and retry
+into the same queue.
+
+`AdmissionMiddleware` puts every HTTP request through one of three gates:
+
+- read    GET / HEAD
+- upload  PUT /api/uploads/{id}: resumable chunks, which spend their time
+          streaming the body to disk and never touch the database
+- write   everything else (SQLite takes one writer at a time anyway)
+
+A gate admits up to `limit` requests at once. Later ones wait in a FIFO
+queue of at most `queue` entries for up to ADMISSION_QUEUE_TIMEOUT seconds.
+A request that finds the queue full, or waits too long, is answered at once
+with 503 and `Retry-After`, which costs far less than serving it late.
+Paths in ADMISSION_EXEMPT (metrics and stats endpoints, static uploads)
+bypass the gates so they stay reachable under overload, and so does the
+page-view beacon (POST /api/posts/{id}/view), which only bumps an in-memory
+counter (views.py).
+
+The default limits follow the database pool (database.py): reads get as
+many slots as the read pool has connections (DB_POOL_SIZE +
+DB_MAX_OVERFLOW), and writes get ADMISSION_WRITE_LIMIT. The AnyIO
+threadpool, 40 threads by default, is resized at startup
+(`configure_threadpool()`) to the read and write limits plus
+ADMISSION_THREADPOOL_HEADROOM. The gated requests can't take more threads
+than they have connections, and the headroom serves what runs outside the
+gates or beside a request's own thread: exempt static files, upload chunks
+and storage work (`run_in_threadpool`), streamed SSR pages and exports.
+
+Gates are per worker process. Queue depth, in-flight requests, admissions,
+waits and sheds are exported at /metrics and at GET /api/admission/stats.
+Compare them with the numbers from benchmarks/api_bench.py when tuning.
+
+Environment:
+- ADMISSION_ENABLED        -> "0" to turn admission control off
+- ADMISSION_READ_LIMIT     -> concurrent reads (default DB_POOL_SIZE + DB_MAX_OVERFLOW)
+- ADMISSION_WRITE_LIMIT    -> concurrent writes (default 4)
+- ADMISSION_READ_QUEUE     -> reads allowed to wait (default 4 x read limit)
+- ADMISSION_WRITE_QUEUE    -> writes allowed to wait (default 8 x write limit)
+- ADMISSION_UPLOAD_LIMIT   -> concurrent upload chunk PUTs (default 8)
+- ADMISSION_UPLOAD_QUEUE   -> chunk PUTs allowed to wait (default 4 x upload limit)
+- ADMISSION_QUEUE_TIMEOUT  -> seconds a request may wait before it is shed (default 5)
+- ADMISSION_RETRY_AFTER    -> Retry-After seconds on 503 responses (default 1)
+- ADMISSION_EXEMPT         -> comma-separated path prefixes that bypass the gates
+                              (default "/metrics,/api/admission/,/api/cache/stats,/uploads/")
+- ADMISSION_THREADPOOL_HEADROOM -> threads beyond the read and write limits (default 16)
+- THREADPOOL_SIZE          -> worker threads (default read limit + write limit + headroom)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+from collections import Counter, deque
+from typing import Any, Dict, Optional
+
+import anyio.to_thread
+
+import metrics
+from database import MAX_OVERFLOW, POOL_SIZE
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT") or POOL_SIZE + MAX_OVERFLOW)
+WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT") or 4)
+READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE") or 4 * READ_LIMIT)
+WRITE_QUEUE = int(os.getenv("ADMISSION_WRITE_QUEUE") or 8 * WRITE_LIMIT)
+UPLOAD_LIMIT = int(os.getenv("ADMISSION_UPLOAD_LIMIT") or 8)
+UPLOAD_QUEUE = int(os.getenv("ADMISSION_UPLOAD_QUEUE") or 4 * UPLOAD_LIMIT)
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT") or 5)
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER") or 1)
+EXEMPT = tuple(
+    p.strip()
+    for p in (os.getenv("ADMISSION_EXEMPT") or "/metrics,/api/admission/,/api/cache/stats,/uploads/").split(",")
+    if p.strip()
+)
+THREADPOOL_HEADROOM = int(os.getenv("ADMISSION_THREADPOOL_HEADROOM") or 16)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE") or READ_LIMIT + WRITE_LIMIT + THREADPOOL_HEADROOM)
+
+READ_METHODS = frozenset({"GET", "HEAD"})
+VIEW_BEACON = re.compile(r"/api/posts/\d+/view")
+UPLOAD_CHUNK = re.compile(r"/api/uploads/[^/]+")
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ----------------------------------------
+# Gates
+# ----------------------------------------
+class Gate:
+    """A FIFO semaphore with a bounded queue and a wait timeout (one event loop only)."""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float):
+        self.name, self.limit, self.queue, self.timeout = name, limit, queue, timeout
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.max_depth = 0
+        self.shed: Counter = Counter()
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted; otherwise why the request is shed ("queue_full" or "timeout")."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.queue:
+            return self._shed("queue_full")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        started = loop.time()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            return self._shed("timeout")
+        except asyncio.CancelledError:  # client went away while queued
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot was handed over just before
+            else:
+                self._discard(waiter)
+            raise
+        finally:
+            wait_seconds.observe((("gate", self.name),), loop.time() - started)
+        self.admitted += 1  # `release()` handed its slot over: `active` is unchanged
+        return None
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _shed(self, reason: str) -> str:
+        self.shed[reason] += 1
+        shed_total.inc((("gate", self.name), ("reason", reason)))
+        return reason
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "timeout": self.timeout,
+            "in_flight": self.active,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+        }
+
+
+read_gate = Gate("read", READ_LIMIT, READ_QUEUE, QUEUE_TIMEOUT)
+write_gate = Gate("write", WRITE_LIMIT, WRITE_QUEUE, QUEUE_TIMEOUT)
+upload_gate = Gate("upload", UPLOAD_LIMIT, UPLOAD_QUEUE, QUEUE_TIMEOUT)
+GATES = (read_gate, write_gate, upload_gate)
+
+
+def gate_for(scope) -> Optional[Gate]:
+    path, method = scope["path"], scope["method"]
+    if not ENABLED or path.startswith(EXEMPT):
+        return None
+    if method in READ_METHODS:
+        return read_gate
+    if method == "POST" and VIEW_BEACON.fullmatch(path):
+        return None
+    if method == "PUT" and UPLOAD_CHUNK.fullmatch(path):
+        return upload_gate
+    return write_gate
+
+
+# ----------------------------------------
+# Metrics / stats
+# ----------------------------------------
+shed_total = metrics.CounterMetric("admission_shed_total", "Requests answered 503 by admission control")
+wait_seconds = metrics.Histogram("admission_wait_seconds", "Time queued requests waited for a slot", WAIT_BUCKETS)
+in_flight = metrics.GaugeMetric(
+    "admission_in_flight", "Requests holding a slot",
+    lambda: [((("gate", g.name),), g.active) for g in GATES],
+)
+queue_depth = metrics.GaugeMetric(
+    "admission_queue_depth", "Requests waiting for a slot",
+    lambda: [((("gate", g.name),), g.depth) for g in GATES],
+)
+metrics.register(shed_total, wait_seconds, in_flight, queue_depth)
+
+
+def _threadpool() -> Dict[str, Any]:
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except Exception:  # no event loop in this thread
+        return {"size": THREADPOOL_SIZE}
+    return {"size": limiter.total_tokens, "busy": limiter.borrowed_tokens}
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "threadpool": _threadpool(),
+        "gates": {g.name: g.stats() for g in GATES},
+    }
+
+
+def configure_threadpool() -> None:
+    """Size AnyIO's default threadpool (call from the running event loop, i.e. the lifespan)."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+# ----------------------------------------
+# Middleware
+# ----------------------------------------
+_BUSY_BODY = json.dumps({"detail": "Server is busy, retry later"}).encode()
+
+
+async def _busy(send, reason: str) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(_BUSY_BODY)).encode()),
+            (b"retry-after", str(RETRY_AFTER).encode()),
+            (b"x-shed-reason", reason.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": _BUSY_BODY})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI: the slot is held until the response, streamed or not, is finished."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        gate = gate_for(scope) if scope["type"] == "http" else None
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        reason = await gate.acquire()
+        if reason is not None:
+            return await _busy(send, reason)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
@@ -0,0 +1,411 @@
+"""Throughput and latency of every JSON API route, against a seeded throwaway DB.
+
+Seeds a temporary SQLite database (--categories, --posts, --words per post
+body, plus a banner). Uploads go to a temporary uploads/ directory as well,
+so neither `wowblog.db` nor `uploads/` is touched. The real `main.app` is then
+driven in two ways:
+
+- asgi:    in-process through httpx's ASGI transport (no sockets, one loop);
+           measures the app itself
+- uvicorn: a local uvicorn server in a child process, with --concurrency
+           HTTP clients; adds the server, the sockets and the process boundary
+
+Each endpoint gets --warmup unrecorded requests, then --requests timed ones
+issued by --concurrency concurrent clients. The report gives throughput,
+p50/p95/p99/max latency and error counts per endpoint. Results are written as
+JSON (--out, default benchmarks/results/api-<timestamp>.json). Pass an earlier
+file as --compare to flag endpoints whose throughput fell, or whose p95 rose,
+by more than --threshold. The exit status is 1 when any did.
+
+Usage:
+
+    python benchmarks/api_bench.py --posts 2000 --words 600 --concurrency 8
+    python benchmarks/api_bench.py --mode asgi --only posts.get,posts.search
+    python benchmarks/api_bench.py --compare benchmarks/results/api-<before>.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+Request = Tuple[str, str, dict]  # method, url, httpx keyword arguments
+
+
+# ----------------------------------------
+# Environment & seed data
+# ----------------------------------------
+def _environment(workdir: Path) -> None:
+    """Point the app at `workdir` (database, uploads). Must run before importing it."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_TMP_DIR"] = str(workdir / ".uploads-tmp")
+    os.chdir(workdir)  # main.py creates and mounts uploads/ relative to the cwd
+
+    import images
+    import storage
+
+    storage.UPLOADS_DIR = images.UPLOADS_DIR = workdir / "uploads"
+    images.VARIANTS_DIR = images.UPLOADS_DIR / "_variants"
+
+
+def _vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    letters = "etaoinshrdlucmfwypvbgk"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def _body(rng: random.Random, vocab: List[str], words: int) -> str:
+    parts, left = [], words
+    while left > 0:
+        if rng.random() < 0.15:
+            parts.append("## " + " ".join(rng.choices(vocab, k=3)).title())
+        n = min(left, rng.randint(40, 120))
+        parts.append(" ".join(rng.choices(vocab, k=n)).capitalize() + ".")
+        left -= n
+    return "\n\n".join(parts)
+
+
+def seed(categories: int, posts: int, words: int, rng: random.Random) -> dict:
+    """Fill the (empty) database; returns what the request builders need."""
+    from sqlalchemy import insert
+
+    from content import process
+    from counters import recount
+    from database import engine, init_db
+    from route.model import Banner, Category, Post
+
+    init_db()
+    vocab = _vocabulary(rng)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Category.__table__), [
+            {
+                "name": f"Category {i}", "slug": f"category-{i}", "description": " ".join(rng.choices(vocab, k=12)),
+                "created_at": now, "updated_at": now,
+            }
+            for i in range(categories)
+        ])
+        # a pool of processed bodies, shared round-robin: seeding stays fast
+        bodies = [(body, process(body)) for body in (_body(rng, vocab, words) for _ in range(min(posts, 64)))]
+        rows = []
+        for i in range(posts):
+            body, done = bodies[i % len(bodies)]
+            created = now - timedelta(minutes=posts - i)
+            rows.append({
+                "title": f"Post {i} " + " ".join(rng.choices(vocab, k=4)),
+                "slug": f"post-{i}",
+                "category_id": i % categories + 1 if categories else None,
+                "status": "active" if rng.random() < 0.9 else "inactive",
+                "excerpt": done.excerpt, "excerpt_auto": True,
+                "content": body, "content_html": done.content_html, "toc": done.toc,
+                "read_time": done.read_time, "views": rng.randint(0, 10_000),
+                "created_at": created, "updated_at": created,
+            })
+        for start in range(0, len(rows), 1000):
+            conn.execute(insert(Post.__table__), rows[start:start + 1000])
+        recount(conn)  # raw inserts bypass the category counters
+        conn.execute(insert(Banner.__table__), [{
+            "heading": "Benchmark", "content": "Seeded banner", "btn1_text": "Read", "btn1_url": "/blog",
+            "created_at": now, "updated_at": now,
+        }])
+    return {"categories": categories, "posts": posts, "words": words, "vocab": vocab[:200]}
+
+
+def _png(kb: int) -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 120, 40)).save(buf, format="PNG")
+    return buf.getvalue() + b"\0" * max(0, kb * 1024 - buf.tell())
+
+
+# ----------------------------------------
+# Endpoints
+# ----------------------------------------
+def endpoints(data: dict, args, tag: str) -> Dict[str, Callable[[int], Request]]:
+    """name -> builder(i) of the i-th request.
+
+    Every mode gets the same request sequence (same seed); `tag` keeps the
+    titles and upload bytes of its writes unique.
+    """
+    rng = random.Random(args.seed)
+    posts, categories, vocab = data["posts"], max(1, data["categories"]), data["vocab"]
+    run = f"{tag}-{time.time_ns()}"
+    png = _png(args.upload_kb)
+    body = _body(rng, vocab, args.words)
+
+    def post_id(_: int) -> int:
+        return rng.randint(1, posts)
+
+    return {
+        "categories.list": lambda i: ("GET", "/api/categories", {}),
+        "categories.get": lambda i: ("GET", f"/api/categories/{rng.randint(1, categories)}", {}),
+        "posts.list": lambda i: ("GET", "/api/posts", {"params": {"limit": 20}}),
+        "posts.list_summary": lambda i: ("GET", "/api/posts", {"params": {"limit": 20, "view": "summary"}}),
+        "posts.search": lambda i: ("GET", "/api/posts/search", {"params": {"q": rng.choice(vocab)}}),
+        "posts.get": lambda i: ("GET", f"/api/posts/{post_id(i)}", {}),
+        "posts.create": lambda i: ("POST", "/api/posts", {"data": {
+            "title": f"Bench {run} {i}", "category_id": str(i % categories + 1), "content": body,
+        }}),
+        "posts.update": lambda i: ("PUT", f"/api/posts/{post_id(i)}", {"data": {
+            "content": f"{body}\n\nRevision {run} {i}",
+        }}),
+        "banner.get": lambda i: ("GET", "/api/banner", {}),
+        # distinct bytes per request, so every upload is stored, not deduplicated
+        "upload": lambda i: ("POST", "/api/upload", {
+            "data": {"type": "misc"},
+            "files": {"file": (f"bench-{i}.png", png + f"{run}-{i}".encode(), "image/png")},
+        }),
+    }
+
+
+# ----------------------------------------
+# Driver
+# ----------------------------------------
+def _percentile(sorted_ms: List[float], pct: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, round(pct / 100 * len(sorted_ms)) - 1))]
+
+
+async def _drive(client, build: Callable[[int], Request], total: int, concurrency: int, start: int) -> dict:
+    seq = count(start)
+    end = start + total
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def worker() -> None:
+        while (i := next(seq)) < end:
+            method, url, kwargs = build(i)
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                status = r.status_code
+            except Exception as e:  # connection errors count, they don't abort the run
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if not (isinstance(status, int) and status < 400):
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+async def _run_all(client, builders: Dict[str, Callable[[int], Request]], args) -> Dict[str, dict]:
+    results = {}
+    for name, build in builders.items():
+        await _drive(client, build, args.warmup, args.concurrency, start=0)
+        results[name] = await _drive(client, build, args.requests, args.concurrency, start=args.warmup)
+        r = results[name]
+        print(
+            f"  {name:20} {r['rps']:9.1f} req/s  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  "
+            f"p99 {r['p99_ms']:8.2f} ms  errors {r['errors']}"
+        )
+    gates = (await client.get("/api/admission/stats")).json()["gates"]  # admission.py; 503s count as errors
+    print("  admission: " + "; ".join(
+        f"{name} limit {g['limit']}, max queue {g['max_queue_depth']}/{g['queue']}, shed {sum(g['shed'].values())}"
+        for name, g in gates.items()
+    ))
+    return results
+
+
+async def bench_asgi(builders, args) -> Dict[str, dict]:
+    import httpx
+
+    import images
+    from database import async_engine
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = await _run_all(client, builders, args)
+    await async_engine.dispose()  # pooled aiosqlite connections are bound to this loop
+    images.shutdown()  # variant workers started by the uploads
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def bench_uvicorn(builders, args, workdir: Path) -> Dict[str, dict]:
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen([
+        sys.executable, str(Path(__file__).resolve()), "--serve", str(port), "--workdir", str(workdir),
+    ])
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    await client.get("/api/banner")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError("uvicorn did not start")
+                    await asyncio.sleep(0.1)
+            return await _run_all(client, builders, args)
+    finally:
+        server.terminate()  # SIGTERM: uvicorn shuts down gracefully
+        server.wait(timeout=30)
+
+
+def serve(port: int, workdir: Path) -> None:
+    _environment(workdir)
+    import uvicorn
+
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ----------------------------------------
+# Reporting
+# ----------------------------------------
+def _meta(args) -> dict:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {
+            k: getattr(args, k)
+            for k in ("categories", "posts", "words", "upload_kb", "requests", "warmup", "concurrency", "seed")
+        },
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> List[str]:
+    """Lines describing endpoints that got slower than `threshold` (relative)."""
+    if old.get("meta", {}).get("params") != new["meta"]["params"]:
+        print("note: the runs used different parameters; differences may not be regressions")
+    flagged = []
+    for mode, results in new["results"].items():
+        for name, r in results.items():
+            before = old.get("results", {}).get(mode, {}).get(name)
+            if not before:
+                continue
+            reasons = []
+            if before["rps"] and r["rps"] < before["rps"] * (1 - threshold):
+                reasons.append(f"throughput {before['rps']} -> {r['rps']} req/s")
+            if before["p95_ms"] and r["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                reasons.append(f"p95 {before['p95_ms']} -> {r['p95_ms']} ms")
+            if r["errors"] > before["errors"]:
+                reasons.append(f"errors {before['errors']} -> {r['errors']}")
+            if reasons:
+                flagged.append(f"{mode} {name}: " + ", ".join(reasons))
+    return flagged
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=600, help="words per post body")
+    parser.add_argument("--upload-kb", type=int, default=64, help="size of each uploaded file")
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("asgi", "uvicorn", "both"), default="both")
+    parser.add_argument("--only", help="comma-separated endpoint names (default: all)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="results file (default: benchmarks/results/api-<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change flagged (default 0.15)")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.workdir)
+        return 0
+
+    out = (args.out or RESULTS_DIR / f"api-{datetime.now():%Y%m%d-%H%M%S}.json").resolve()
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    workdir = Path(tempfile.mkdtemp(prefix="wowblog-bench-"))
+    try:
+        _environment(workdir)
+        t0 = time.perf_counter()
+        data = seed(args.categories, args.posts, args.words, random.Random(args.seed))
+        print(f"seeded {args.categories} categories, {args.posts} posts in {time.perf_counter() - t0:.1f}s")
+
+        def builders(mode: str) -> Dict[str, Callable[[int], Request]]:
+            every = endpoints(data, args, mode)
+            return {n: every[n] for n in wanted} if wanted else every
+
+        wanted = [n.strip() for n in args.only.split(",")] if args.only else None
+        unknown = set(wanted or ()) - builders("check").keys()
+        if unknown:
+            parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+        report = {"meta": _meta(args), "results": {}}
+        if args.mode in ("asgi", "both"):
+            print("asgi (in-process)")
+            report["results"]["asgi"] = asyncio.run(bench_asgi(builders("asgi"), args))
+        if args.mode in ("uvicorn", "both"):
+            print(f"uvicorn (concurrency {args.concurrency})")
+            report["results"]["uvicorn"] = asyncio.run(bench_uvicorn(builders("uvicorn"), args, workdir))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"results written to {out}")
+
+    if baseline is not None:
+        flagged = compare(baseline, report, args.threshold)
+        for line in flagged:
+            print(f"REGRESSION {line}")
+        if not flagged:
+            print(f"no regressions beyond {args.threshold:.0%} against {args.compare}")
+        return 1 if flagged else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Check content.py's rendering of hostile and awkward post bodies.
+
+Runs `content.process()` on each input below and compares the rendered
+`content_html` (and, where given, the generated excerpt) with what it must
+be. No database or app needed. Exits with status 1 when any check fails.
+
+Usage:
+
+    python benchmarks/content_sanitize.py
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# (label, post content, expected content_html)
+HTML_CASES = [
+    ("javascript: link, balanced parens", "[x](javascript:alert(1))", "<p><a>x</a></p>"),
+    (
+        "parens inside a URL",
+        "[w](https://en.wikipedia.org/wiki/Foo_(bar)) end",
+        '<p><a href="https://en.wikipedia.org/wiki/Foo_(bar)" rel="nofollow noopener">w</a> end</p>',
+    ),
+    ("text after a link", "[a](/p) and (aside)", '<p><a href="/p">a</a> and (aside)</p>'),
+    ("obfuscated scheme", '<a href="java\tscript:alert(1)">x</a>', "<a>x</a>"),
+    ("control characters in the scheme", '<a href="\x01javascript:alert(1)">x</a>', "<a>x</a>"),
+    ("data: image", '<p><img src="data:text/html;base64,PHNjcmlwdD4="></p>', "<p></p>"),
+    ("script element", "<p>hi<script>alert(1)</script></p>", "<p>hi</p>"),
+]
+
+# (label, post content, expected excerpt): plain text, escaped only by templates
+EXCERPT_CASES = [
+    ("markup-like text", "Tom & Jerry <3 <script>", "Tom & Jerry <3 <script>"),
+    ("entities in HTML", "<p>Tom &amp; Jerry &lt;b&gt;</p>", "Tom & Jerry <b>"),
+]
+
+
+def main() -> None:
+    from content import process
+
+    failures = []
+
+    def check(label: str, got, expected) -> None:
+        ok = got == expected
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}: {got!r}" + ("" if ok else f" (expected {expected!r})"))
+        if not ok:
+            failures.append(label)
+
+    print("content_html")
+    for label, source, expected in HTML_CASES:
+        check(label, process(source).content_html, expected)
+    print("excerpt")
+    for label, source, expected in EXCERPT_CASES:
+        check(label, process(source).excerpt, expected)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Cross-worker cache invalidation: stale reads and per-request check cost.
+
+Starts two worker processes that each load the app against the same
+temporary copy of the database, the way several uvicorn/gunicorn workers
+share `wowblog.db`:
+
+- the writer updates a post, a category and the banner through the API
+- the reader, whose caches are already warm, re-reads all three right after
+  each write and counts responses that still show the old value
+
+The check runs twice: with the shared generation file (cache.py) and with
+CACHE_SHARED_FILE=0, the per-process-only setup, to show what it prevents.
+
+It then times cache hits with and without the shared-memory generation check
+to measure the per-request overhead.
+
+Usage:
+
+    python benchmarks/cross_worker.py --rounds 200
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def _prepare(tmp: str) -> str:
+    db = Path(tmp) / "bench.db"
+    if (ROOT / "wowblog.db").exists():
+        shutil.copy(ROOT / "wowblog.db", db)
+    return f"sqlite:///{db}"
+
+
+def _client(env: dict):
+    # runs in a fresh (spawned) process: configure before importing the app
+    os.environ.update(env)
+    os.chdir(env["BENCH_DIR"])
+    from fastapi.testclient import TestClient
+
+    import cache
+    from database import init_db
+    from main import app
+
+    # TestClient only runs the lifespan when used as a context manager
+    init_db()
+    cache.open_shared()
+    return TestClient(app)
+
+
+def _fixture(c) -> tuple[int, int]:
+    cats = c.get("/api/categories").json()
+    if cats:
+        cat_id = cats[0]["id"]
+    else:
+        cat_id = c.post("/api/categories", data={"name": f"bench {time.time_ns()}"}).json()["id"]
+    post = c.post(
+        "/api/posts",
+        data={"title": f"cross worker {time.time_ns()}", "category_id": str(cat_id), "content": "x"},
+    ).json()
+    c.put("/api/banner", json={"heading": "v0"})
+    return post["id"], cat_id
+
+
+def writer(env: dict, rounds: int, ready, to_reader, from_reader) -> None:
+    c = _client(env)
+    ready.set()  # tables exist; the reader may start its own app
+    post_id, cat_id = _fixture(c)
+    to_reader.put((post_id, cat_id))
+    from_reader.get()  # reader caches are warm
+    for i in range(1, rounds + 1):
+        c.put(f"/api/posts/{post_id}", data={"excerpt": f"v{i}"})
+        c.put(f"/api/categories/{cat_id}", data={"description": f"v{i}"})
+        c.put("/api/banner", json={"heading": f"v{i}"})
+        to_reader.put(i)
+        from_reader.get()
+    to_reader.put(None)
+    c.delete(f"/api/posts/{post_id}")
+
+
+def reader(env: dict, rounds: int, to_reader, from_reader, results) -> None:
+    c = _client(env)
+    post_id, cat_id = to_reader.get()
+
+    def read_all():
+        post = c.get(f"/api/posts/{post_id}").json()
+        listed = c.get("/api/posts", params={"view": "summary", "limit": 5}).json()["items"]
+        cat = c.get(f"/api/categories/{cat_id}").json()
+        banner = c.get("/api/banner").json()
+        listed_excerpt = next((p["excerpt"] for p in listed if p["id"] == post_id), None)
+        return post["excerpt"], listed_excerpt, cat["description"], banner["heading"]
+
+    read_all()
+    read_all()  # second pass is served from cache
+    from_reader.put("warm")
+    stale = reads = 0
+    while (i := to_reader.get()) is not None:
+        for value in read_all():
+            reads += 1
+            stale += value != f"v{i}"
+        from_reader.put(i)
+
+    import cache
+
+    results.put({"reads": reads, "stale": stale, "stats": cache.stats()["caches"]})
+
+
+def run(shared: bool, rounds: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="wowblog-xworker-")
+    env = {
+        "DATABASE_URL": _prepare(tmp),
+        "BENCH_DIR": tmp,
+        "CACHE_SHARED_FILE": str(Path(tmp) / "bench.cachegen") if shared else "0",
+        "CACHE_TTL": "3600",
+        "IMAGE_VARIANTS": "0",
+    }
+    ctx = multiprocessing.get_context("spawn")
+    ready, to_reader, from_reader, results = ctx.Event(), ctx.Queue(), ctx.Queue(), ctx.Queue()
+    procs = [
+        ctx.Process(target=writer, args=(env, rounds, ready, to_reader, from_reader)),
+        ctx.Process(target=reader, args=(env, rounds, to_reader, from_reader, results)),
+    ]
+    procs[0].start()
+    ready.wait()
+    procs[1].start()
+    result = results.get()
+    for p in procs:
+        p.join()
+    shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+def overhead(iterations: int) -> tuple[float, float]:
+    """ns per cache hit: process-local only vs with the shared generation check."""
+    os.environ["CACHE_SHARED_FILE"] = "0"  # don't map a file next to the real DB
+    from cache import Generations, TTLCache
+
+    tmp = tempfile.mkdtemp(prefix="wowblog-xworker-")
+    local = TTLCache("local")
+    shared = TTLCache("shared", shared=Generations(str(Path(tmp) / "gen")), slot=0)
+    timings = []
+    for c in (local, shared):
+        c.set(("get", 1), {"id": 1})
+        t0 = time.perf_counter_ns()
+        for _ in range(iterations):
+            c.get(("get", 1))
+        timings.append((time.perf_counter_ns() - t0) / iterations)
+    shutil.rmtree(tmp, ignore_errors=True)
+    return timings[0], timings[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for shared in (False, True):
+        r = run(shared, args.rounds)
+        label = "shared generations" if shared else "per-process only"
+        remote = sum(s["remote_invalidations"] for s in r["stats"].values())
+        print(f"{label:20} reads={r['reads']:5} stale={r['stale']:5} remote_invalidations={remote}")
+
+    local_ns, shared_ns = overhead(args.iterations)
+    print(
+        f"cache hit: local {local_ns:.0f} ns, with shared check {shared_ns:.0f} ns "
+        f"(+{shared_ns - local_ns:.0f} ns per lookup)"
+    )
+
+
+if __name__ == "__main__":
+    main()
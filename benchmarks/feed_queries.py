@@ -0,0 +1,156 @@
+"""Check that GET /api/feed runs a fixed number of SQL statements, whatever the data size.
+
+Seeds a temporary database (api_bench's seed data), then calls the endpoint
+in-process. It counts statements per request through metrics.py's
+per-request stats (the `db;desc="N queries"` entry of Server-Timing), at
+each of --sizes, growing the same database in between:
+
+    first request   validators + banner + categories + posts  (FEED_QUERIES)
+    repeat          none: body and validators come from the cache
+    If-None-Match   none: 304 from the cached validators
+    after a write   FEED_QUERIES again (the write moved the cache versions)
+
+It also checks the category post counts against a plain GROUP BY count,
+and the body against the HomeFeed schema.
+Exits with status 1 when any check fails.
+
+Usage:
+
+    python benchmarks/feed_queries.py --sizes 10,1000,10000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_bench import _environment, seed  # noqa: E402
+
+FEED_QUERIES = 4
+CACHED_QUERIES = 0
+
+
+def _queries(response) -> int:
+    match = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers.get("server-timing", ""))
+    if match is None:
+        raise SystemExit("no Server-Timing header; is METRICS_SERVER_TIMING off?")
+    return int(match.group(1))
+
+
+def _grow(total: int, categories: int) -> None:
+    """Add posts (and a category per 100 posts) until there are `total` posts."""
+    from sqlalchemy import func, insert
+    from sqlmodel import select
+
+    from cache import invalidate_all
+    from counters import recount
+    from database import engine
+    from route.model import Category, Post
+
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        have = conn.execute(select(func.count()).select_from(Post)).scalar()
+        cats = conn.execute(select(func.count()).select_from(Category)).scalar()
+        wanted = max(categories, total // 100)
+        if wanted > cats:
+            conn.execute(insert(Category.__table__), [
+                {"name": f"Extra {i}", "slug": f"extra-{i}", "created_at": now, "updated_at": now}
+                for i in range(cats, wanted)
+            ])
+        rows = [
+            {
+                "title": f"Extra post {i}", "slug": f"extra-post-{i}", "category_id": i % wanted + 1,
+                "status": "active" if i % 3 else "inactive", "content": "x", "excerpt": "x",
+                "created_at": now, "updated_at": now,
+            }
+            for i in range(have, total)
+        ]
+        for start in range(0, len(rows), 1000):
+            conn.execute(insert(Post.__table__), rows[start:start + 1000])
+        recount(conn)
+    invalidate_all()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,10000", help="comma-separated post counts")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    sizes: List[int] = sorted(int(n) for n in args.sizes.split(","))
+
+    workdir = Path(tempfile.mkdtemp(prefix="wowblog-feed-"))
+    failures = []
+
+    def check(label: str, got, expected) -> None:
+        ok = got == expected
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}: {got}" + ("" if ok else f" (expected {expected})"))
+        if not ok:
+            failures.append(label)
+
+    try:
+        _environment(workdir)
+        seed(args.categories, sizes[0], 40, random.Random(1))
+
+        from fastapi.testclient import TestClient
+        from sqlalchemy import func
+        from sqlmodel import Session, select
+
+        from database import engine
+        from main import app
+        from route.model import Post
+        from schema import HomeFeed
+
+        with TestClient(app) as client:
+            for size in sizes:
+                _grow(size, args.categories)
+                print(f"{size} posts")
+                url = f"/api/feed?limit={args.limit}"
+                first = client.get(url)
+                check("status", first.status_code, 200)
+                check("statements, first request", _queries(first), FEED_QUERIES)
+                check("statements, repeat", _queries(client.get(url)), CACHED_QUERIES)
+                revalidated = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+                check("If-None-Match status", revalidated.status_code, 304)
+                check("statements, If-None-Match", _queries(revalidated), CACHED_QUERIES)
+                category = client.get("/api/categories").json()[0]
+                client.put(f"/api/categories/{category['id']}", data={"description": f"edited at {size}"})
+                after = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+                check("status after a write", after.status_code, 200)
+                check("statements after a write", _queries(after), FEED_QUERIES)
+                first = after
+
+                feed = first.json()
+                check("posts returned", len(feed["posts"]), min(args.limit, size))
+                with Session(engine) as session:
+                    counts = {
+                        cat: (total, active) for cat, total, active in session.exec(
+                            select(Post.category_id, func.count(), func.count().filter(Post.status == "active"))
+                            .group_by(Post.category_id)
+                        ).all()
+                    }
+                wrong = [
+                    c["id"] for c in feed["categories"]
+                    if (c["post_count"], c["active_post_count"]) != counts.get(c["id"], (0, 0))
+                ]
+                check(f"categories with wrong post counts (of {len(feed['categories'])})", wrong, [])
+                check("matches the HomeFeed schema", HomeFeed.model_validate(feed).model_dump(mode="json") == feed, True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Rows/sec of GET /api/posts (full view, unpaginated) before and after the fast JSON path.
+
+Seeds a temporary database with the largest --sizes value (using
+api_bench's seed data), then builds the response body for the first N posts
+in two ways:
+
+- orm:  what list_posts did before: load Post objects, validate them into
+        PostRead, re-validate and serialize them against the route's
+        response_model as FastAPI does, then encode them with JSONResponse
+- fast: what it does now: select plain columns, make dicts and encode them
+        with fastjson.dumps (orjson when installed)
+
+Both bodies must be identical. Neither path goes through the read cache, and
+each run uses a fresh session. The best of --repeat runs is reported.
+
+Usage:
+
+    python benchmarks/json_bench.py --sizes 1000,10000,100000 --words 150
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_bench import _environment, seed  # noqa: E402
+
+
+def _best(build: Callable[[], bytes], repeat: int) -> tuple[float, bytes]:
+    best, body = float("inf"), b""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = build()
+        best = min(best, time.perf_counter() - t0)
+    return best, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--words", type=int, default=150, help="words per post body")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sizes: List[int] = sorted(int(n) for n in args.sizes.split(","))
+
+    workdir = Path(tempfile.mkdtemp(prefix="wowblog-json-"))
+    try:
+        _environment(workdir)
+        print(f"seeding {sizes[-1]} posts ...", flush=True)
+        seed(20, sizes[-1], args.words, random.Random(args.seed))
+
+        from fastapi.responses import JSONResponse
+        from fastapi.routing import serialize_response
+        from sqlmodel import Session, select
+
+        import fastjson
+        from database import read_engine
+        from main import app
+        from route.blog import POST_COLUMNS, list_posts, query_posts
+        from route.model import Post
+        from route.pagination import keyset_order
+        from schema import PostRead
+
+        logging.getLogger("metrics").setLevel(logging.ERROR)  # the 100k-row queries are slow by design
+        route = next(r for r in app.routes if getattr(r, "endpoint", None) is list_posts)
+
+        def orm(where) -> bytes:
+            with Session(read_engine) as session:
+                rows = session.exec(select(Post).where(*where).order_by(*keyset_order(Post))).all()
+                models = [PostRead.model_validate(r) for r in rows]
+            content = asyncio.run(serialize_response(field=route.response_field, response_content=models))
+            return JSONResponse(content).body
+
+        def fast(where) -> bytes:
+            with Session(read_engine) as session:
+                data = query_posts(session, POST_COLUMNS, where, None, None)
+            return fastjson.FastJSONResponse(fastjson.dumps(data)).body
+
+        encoder = "orjson" if fastjson.orjson is not None else "json"
+        print(f"{'rows':>8} {'orm rows/s':>12} {'fast rows/s':>12} {'speedup':>8} {'body MB':>8}   (fast: {encoder})")
+        for n in sizes:
+            where = [Post.id <= n]
+            t_orm, body_orm = _best(lambda: orm(where), args.repeat)
+            t_fast, body_fast = _best(lambda: fast(where), args.repeat)
+            if body_orm != body_fast:
+                raise SystemExit(f"bodies differ at {n} rows")
+            print(f"{n:8d} {n / t_orm:12.0f} {n / t_fast:12.0f} {t_orm / t_fast:7.1f}x {len(body_fast) / 1e6:8.1f}")
+    finally:
+        import images
+
+        images.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
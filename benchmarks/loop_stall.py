@@ -0,0 +1,147 @@
+"""Event-loop stall under mixed read/write load: sync vs async DB writes.
+
+Drives the real app in-process (httpx ASGI transport, same event loop) with
+concurrent readers and writers, while a probe task sleeps 1 ms at a time and
+records how late it wakes up. Any blocking work done on the loop shows up as
+probe lateness.
+
+Two write paths are compared:
+
+- before: the old pattern, an `async def` route committing through the sync
+  `Session` (mounted here as a throwaway route that mirrors the old
+  `create_post`)
+- after:  the real `POST /api/posts`, which uses the async session
+
+Usage (runs against a temporary copy of the database):
+
+    python benchmarks/loop_stall.py --seconds 5 --concurrency 16
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from itertools import count
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.mkdtemp(prefix="wowblog-bench-")
+_db = Path(_tmp) / "bench.db"
+if (ROOT / "wowblog.db").exists():
+    shutil.copy(ROOT / "wowblog.db", _db)
+os.environ["DATABASE_URL"] = f"sqlite:///{_db}"
+os.chdir(_tmp)
+
+import httpx  # noqa: E402
+from fastapi import Form  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from database import async_engine, engine, init_db  # noqa: E402
+from main import app  # noqa: E402
+from route.model import Category, Post  # noqa: E402
+
+init_db()  # the ASGI transport doesn't run the app's lifespan
+
+
+@app.post("/_bench/legacy-posts", status_code=201, include_in_schema=False)
+async def legacy_create_post(title: str = Form(...), category_id: int = Form(...), content: str = Form(...)):
+    # The pre-async create_post: sync Session calls inside `async def`
+    with Session(engine) as session:
+        if not session.get(Category, category_id):
+            return {"error": "Invalid category_id"}
+        slug = title.lower().replace(" ", "-")
+        if session.exec(select(Post).where(Post.slug == slug)).first():
+            return {"error": "exists"}
+        post = Post(title=title, slug=slug, category_id=category_id, content=content)
+        session.add(post)
+        session.commit()
+        session.refresh(post)
+        return {"id": post.id}
+
+
+async def _probe(stop: asyncio.Event, lags: list[float]) -> None:
+    interval = 0.001
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - t0 - interval))
+
+
+async def _run(write_path: str, seconds: float, concurrency: int, write_ratio: float) -> dict:
+    with Session(engine) as session:
+        cat = session.exec(select(Category)).first()
+        if cat is None:
+            cat = Category(name="bench", slug=f"bench-{time.time_ns()}")
+            session.add(cat)
+            session.commit()
+            session.refresh(cat)
+        cat_id = cat.id
+
+    transport = httpx.ASGITransport(app=app)
+    seq = count()
+    stop = asyncio.Event()
+    lags: list[float] = []
+    done = {"reads": 0, "writes": 0}
+    tag = f"{write_path.strip('/').replace('/', '-')}-{time.time_ns()}"
+
+    async def worker(n: int) -> None:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while not stop.is_set():
+                i = next(seq)
+                if (i % 100) < write_ratio * 100:
+                    data = {"title": f"{tag} {i}", "category_id": str(cat_id), "content": "x " * 200}
+                    await client.post(write_path, data=data)
+                    done["writes"] += 1
+                else:
+                    await client.get("/api/posts", params={"view": "summary", "limit": 20})
+                    done["reads"] += 1
+
+    probe = asyncio.create_task(_probe(stop, lags))
+    workers = [asyncio.create_task(worker(n)) for n in range(concurrency)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(probe, *workers)
+    # pooled aiosqlite connections are bound to this loop (and keep it alive)
+    await async_engine.dispose()
+
+    lags.sort()
+    ms = lambda v: round(v * 1000, 2)  # noqa: E731
+    return {
+        "write_path": write_path,
+        "reads": done["reads"],
+        "writes": done["writes"],
+        "probe_samples": len(lags),
+        "lag_p50_ms": ms(statistics.median(lags)) if lags else 0,
+        "lag_p99_ms": ms(lags[int(len(lags) * 0.99) - 1]) if lags else 0,
+        "lag_max_ms": ms(lags[-1]) if lags else 0,
+        "stalled_ms": ms(sum(v for v in lags if v > 0.005)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for path in ("/_bench/legacy-posts", "/api/posts"):
+        label = "before (sync session)" if path.startswith("/_bench") else "after (async session)"
+        r = asyncio.run(_run(path, args.seconds, args.concurrency, args.write_ratio))
+        print(
+            f"{label:24} reads={r['reads']:6} writes={r['writes']:5} "
+            f"lag p50={r['lag_p50_ms']}ms p99={r['lag_p99_ms']}ms max={r['lag_max_ms']}ms "
+            f"stalled={r['stalled_ms']}ms"
+        )
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Worker cold start: import time, startup (lifespan) time and time to first response.
+
+Every measurement runs in a fresh interpreter, like a newly spawned worker,
+against temporary databases:
+
+- import    `import main`; must not touch the database or the filesystem
+- startup   `main.prepare()`, what the lifespan runs before serving, for:
+            new       an empty database: every migration runs
+            existing  a copy of wowblog.db before its first versioned start
+            current   an up-to-date database: one version lookup
+            legacy    what each start used to do instead (create_all schema
+                      reflection + FTS DDL), for comparison
+- uvicorn   process spawn until the first 200 from GET /api/categories
+
+Usage:
+
+    python benchmarks/startup.py --runs 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+if MODE == "legacy":
+    from sqlmodel import SQLModel
+    from database import engine
+    from search import install_fts
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        install_fts(conn)
+else:
+    main.prepare()
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1}))
+"""
+
+
+def _env(db: Path) -> Dict[str, str]:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db}", "PYTHONPATH": str(ROOT)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # deployed workers import from .pyc
+    return env
+
+
+def _child(db: Path, mode: str) -> Dict[str, float]:
+    env = _env(db)
+    out = subprocess.run(
+        [sys.executable, "-c", f"MODE = {mode!r}\n{CHILD}"],
+        cwd=db.parent, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _uvicorn_first_response(db: Path) -> float:
+    port = _free_port()
+    env = _env(db)
+    t0 = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/categories", timeout=5) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - t0
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _report(label: str, samples: List[float]) -> None:
+    ms = sorted(v * 1000 for v in samples)
+    print(f"  {label:24} median {statistics.median(ms):8.1f} ms   min {ms[0]:8.1f} ms   max {ms[-1]:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="wowblog-startup-"))
+    source = ROOT / "wowblog.db"
+    try:
+        imports, startup = [], {"new": [], "existing": [], "current": [], "legacy": []}
+        _child(tmp / "warmup.db", "new")  # writes the .pyc files the timed runs use
+        for i in range(args.runs):
+            new = tmp / f"new-{i}.db"
+            startup["new"].append(_child(new, "new")["startup"])
+            if source.exists():
+                existing = tmp / f"existing-{i}.db"
+                shutil.copy(source, existing)
+                startup["existing"].append(_child(existing, "existing")["startup"])
+            r = _child(new, "current")  # migrated by the first run
+            imports.append(r["import"])
+            startup["current"].append(r["startup"])
+            startup["legacy"].append(_child(new, "legacy")["startup"])
+
+        print(f"import main ({args.runs} runs)")
+        _report("import", imports)
+        print("startup (main.prepare)")
+        for label, samples in startup.items():
+            if samples:
+                _report(label, samples)
+        print("uvicorn spawn -> first response")
+        _report("up-to-date database", [_uvicorn_first_response(tmp / "new-0.db") for _ in range(args.runs)])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Check that uploads can't be served as HTML, whatever the client calls them.
+
+Uploads through POST /api/upload, into a temporary database and uploads/,
+then fetches what was stored from /uploads:
+
+    evil.html, text/plain, "<script>"  (misc)   stored as .txt, served as text/plain
+    PNG bytes named cover.html         (posts)  stored as .png, served as image/png
+    SVG with <script>                  (posts, misc)  rejected with 415
+    an .html file already in uploads/          served as a download (attachment)
+
+Every /uploads response must carry `X-Content-Type-Options: nosniff`.
+Exits with status 1 when any check fails.
+
+Usage:
+
+    python benchmarks/upload_types.py
+"""
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_bench import _environment  # noqa: E402
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+
+
+def _png() -> bytes:
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), (200, 30, 30)).save(out, "PNG")
+    return out.getvalue()
+
+
+def main() -> None:
+    workdir = Path(tempfile.mkdtemp(prefix="wowblog-uploads-"))
+    failures = []
+
+    def check(label: str, got, expected) -> None:
+        ok = got == expected
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}: {got}" + ("" if ok else f" (expected {expected})"))
+        if not ok:
+            failures.append(label)
+
+    try:
+        os.environ["IMAGE_VARIANTS"] = "0"  # no worker processes outliving the temp dir
+        _environment(workdir)
+
+        from fastapi.testclient import TestClient
+
+        import storage
+        from main import app
+
+        with TestClient(app) as client:
+            def upload(bucket: str, name: str, body: bytes, content_type: str):
+                return client.post("/api/upload", data={"type": bucket}, files={"file": (name, body, content_type)})
+
+            def served(url: str):
+                response = client.get(url)
+                check(f"{url} nosniff", response.headers.get("x-content-type-options"), "nosniff")
+                return response
+
+            print("evil.html as text/plain")
+            r = upload("misc", "evil.html", b"<script>alert(1)</script>", "text/plain")
+            check("status", r.status_code, 200)
+            url = r.json()["url"]
+            check("stored extension", Path(url).suffix, ".txt")
+            check("served as", served(url).headers["content-type"].split(";")[0], "text/plain")
+
+            print("PNG named cover.html")
+            r = upload("posts", "cover.html", _png(), "image/png")
+            check("status", r.status_code, 200)
+            url = r.json()["url"]
+            check("stored extension", Path(url).suffix, ".png")
+            check("served as", served(url).headers["content-type"], "image/png")
+
+            print("SVG with <script>")
+            for bucket in ("posts", "misc"):
+                check(f"{bucket} status", upload(bucket, "logo.svg", SVG, "image/svg+xml").status_code, 415)
+                check(f"{bucket} status, declared text/plain", upload(bucket, "logo.txt", SVG, "text/plain").status_code, 415)
+
+            print("legacy .html file")
+            (storage.UPLOADS_DIR / "misc").mkdir(parents=True, exist_ok=True)
+            (storage.UPLOADS_DIR / "misc" / "20240101000000_old.html").write_bytes(b"<script>alert(1)</script>")
+            r = served("/uploads/misc/20240101000000_old.html")
+            check("disposition", r.headers.get("content-disposition"), "attachment")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
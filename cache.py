@@ -0,0 +1,291 @@
+"""In-process read cache for banner, categories and posts.
+
+Reads outnumber writes by orders of magnitude, so the read routes keep their
+results in small bounded LRU caches with a TTL, and every write route
+invalidates exactly what it changed right after committing:
+
+    found, value = posts_cache.get(key)
+    if not found:
+        gen = posts_cache.generation
+        value = load()
+        posts_cache.set(key, value, gen)
+
+Keys are tuples whose first item is the kind of read ("list", "get",
+"search", ...), so writers can drop one kind, or one entry, at a time.
+Passing the generation read *before* loading to `set()` prevents a slow
+reader from caching data that a concurrent write already invalidated.
+
+Cached values are shared between requests and must be treated as read-only.
+
+Multiple worker processes
+-------------------------
+Each worker has its own caches, so a write handled by one worker must reach
+the others. Every cache owns a 64-bit counter slot in a small file that all
+workers memory-map (`Generations`). Writers bump their slot (under an
+exclusive flock) on every invalidation. Readers compare the slot with the
+last value they saw before every lookup; this is one unlocked 8-byte read
+from shared memory, with no syscall and no DB round-trip. When the slot has
+moved, that worker drops its whole cache. Invalidation across workers is
+therefore per-cache rather than per-key, which is fine given how rare writes
+are.
+
+The file is opened by `open_shared()`, which the app calls at startup (the
+lifespan in main.py), so importing this module creates and maps nothing.
+Processes that change the database outside the app (maintenance CLIs) call
+`invalidate_all()`, which opens it on first use, so that running workers
+notice too.
+
+Environment:
+- CACHE_ENABLED      -> "0" to disable (every get is a miss, nothing is stored)
+- CACHE_MAXSIZE      -> entries per cache (default 1024)
+- CACHE_TTL          -> seconds an entry may live (default 300)
+- CACHE_SHARED_FILE  -> path of the shared generation file (default: next to
+                        the SQLite database, "<db>.cachegen"); "0" turns
+                        cross-worker invalidation off
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from sqlalchemy import make_url
+
+from database import DATABASE_URL
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+MAXSIZE = int(os.getenv("CACHE_MAXSIZE") or 1024)
+TTL = float(os.getenv("CACHE_TTL") or 300)
+
+
+def _default_shared_file() -> Optional[str]:
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return f"{url.database}.cachegen"
+
+
+SHARED_FILE = os.getenv("CACHE_SHARED_FILE") or _default_shared_file()
+if SHARED_FILE == "0":
+    SHARED_FILE = None
+
+_SLOT = struct.Struct("<Q")
+
+
+class Generations:
+    """Per-cache 64-bit counters in a memory-mapped file shared by all workers."""
+
+    SLOTS = 8
+
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = self.SLOTS * _SLOT.size
+            if os.fstat(fd).st_size < size:
+                self._flock(fd, True)
+                try:
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                finally:
+                    self._flock(fd, False)
+            self._map = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    @staticmethod
+    def _flock(fd: int, lock: bool) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if lock else fcntl.LOCK_UN)
+
+    def read(self, slot: int) -> int:
+        return _SLOT.unpack_from(self._map, slot * _SLOT.size)[0]
+
+    def bump(self, slot: int) -> Tuple[int, int]:
+        """Increment `slot`; returns (value before, value after)."""
+        self._flock(self._fd, True)
+        try:
+            before = self.read(slot)
+            _SLOT.pack_into(self._map, slot * _SLOT.size, before + 1)
+            return before, before + 1
+        finally:
+            self._flock(self._fd, False)
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = MAXSIZE,
+        ttl: float = TTL,
+        shared: Optional[Generations] = None,
+        slot: int = 0,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = shared
+        self._slot = slot
+        self._seen = shared.read(slot) if shared else 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def attach(self, shared: Generations) -> None:
+        """Start following `shared`; entries cached until now are dropped."""
+        with self._lock:
+            self._shared = shared
+            self._seen = shared.read(self._slot)
+            self._data.clear()
+            self.generation += 1
+
+    def _sync(self) -> None:
+        """Drop everything if another process invalidated this cache (lock held)."""
+        if self._shared is None:
+            return
+        current = self._shared.read(self._slot)
+        if current != self._seen:
+            self._seen = current
+            self._data.clear()
+            self.generation += 1
+            self.remote_invalidations += 1
+
+    def _bump(self) -> bool:
+        """Publish a local invalidation; True if other writes were missed meanwhile."""
+        self.generation += 1
+        self.invalidations += 1
+        if self._shared is None:
+            return False
+        before, after = self._shared.bump(self._slot)
+        missed = before != self._seen
+        self._seen = after
+        return missed
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            self._sync()
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._sync()
+            if generation is not None and generation != self.generation:
+                return  # invalidated while the value was being loaded
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def version(self) -> int:
+        """The generation, after picking up other workers' invalidations; moves on every invalidation."""
+        with self._lock:
+            self._sync()
+            return self.generation
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            if self._bump():
+                self._data.clear()
+            self._data.pop(key, None)
+
+    def forget(self, keys: Iterable[Hashable]) -> None:
+        """Drop `keys` in this process only: no invalidation, so no other worker notices.
+
+        For values that may lag behind for up to the TTL (view counts).
+        """
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self, kind: Optional[str] = None) -> None:
+        """Drop every entry, or only those whose key starts with `kind`."""
+        with self._lock:
+            if self._bump() or kind is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if k[0] == kind]:
+                    del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "remote_invalidations": self.remote_invalidations,
+            }
+
+
+generations: Optional[Generations] = None
+_open_lock = threading.Lock()
+
+banner_cache = TTLCache("banner", slot=0)
+categories_cache = TTLCache("categories", slot=1)
+posts_cache = TTLCache("posts", slot=2)
+# Rendered HTML (route/pages.py). Keys embed the rows' updated_at, so an edit
+# simply makes new keys; old fragments age out and need no invalidation.
+fragments_cache = TTLCache("fragments", maxsize=4 * MAXSIZE)
+# Encoded GET /api/feed bodies and their validators (route/feed.py). Keys
+# embed the versions of the three caches above, so any write that
+# invalidates one of them makes new keys: same idea.
+feed_cache = TTLCache("feed", maxsize=64)
+
+CACHES = {c.name: c for c in (banner_cache, categories_cache, posts_cache, fragments_cache, feed_cache)}
+SHARED_CACHES = (banner_cache, categories_cache, posts_cache)
+
+
+def open_shared() -> Optional[Generations]:
+    """Map SHARED_FILE (creating it if needed) and attach the shared caches; idempotent."""
+    global generations
+    if SHARED_FILE is None:
+        return None
+    with _open_lock:
+        if generations is None:
+            generations = Generations(SHARED_FILE)
+            for c in SHARED_CACHES:
+                c.attach(generations)
+    return generations
+
+
+def invalidate_all() -> None:
+    open_shared()
+    for c in CACHES.values():
+        c.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "shared_file": SHARED_FILE,
+        "caches": {name: c.stats() for name, c in CACHES.items()},
+    }
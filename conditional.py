@@ -0,0 +1,162 @@
+"""Conditional GET (ETag / Last-Modified / 304) for the JSON read endpoints.
+
+Validators come from one small aggregate query and never from the response
+body, so a matching `If-None-Match` / `If-Modified-Since` is answered with
+304 without loading ORM objects or running pydantic serialization:
+
+- a single row:  its `id` and `updated_at`
+- a listing:     `count(*)`, `max(updated_at)` and `max(id)` over the rows the
+                 filters select, plus the request's parameters (filters,
+                 page cursor, view/fields), so every distinct URL has its
+                 own tag
+- a combination: the same three aggregates for each of several row sets
+                 (GET /api/feed), still read in one query
+
+Creating, editing or deleting a row moves at least one of these values, so
+the tag changes whenever the body would. The one exception is view counts,
+which the view counter (views.py) changes without touching `updated_at`: a
+single post's tag includes its `views`, while listings, like their cached
+bodies, let them lag for up to CACHE_TTL rather than change on every flush.
+
+The aggregates still scan every matching row, so routes with a read cache
+(cache.py) go through `cached()`: the validators are stored in the same
+entry as the body they describe. A cache hit, 304 or not, runs no query at
+all, and a tag is never paired with a body from a different moment. The
+write routes' invalidation (after commit) drops both together.
+
+Responses carry `Cache-Control: no-cache`: clients may keep them, but must
+revalidate before reuse (which is the cheap 304 path above).
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+CACHE_CONTROL = "no-cache"
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+    count: int
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = http_date(self.last_modified)
+        return headers
+
+
+def http_date(dt: datetime) -> str:
+    # stored timestamps are naive UTC (datetime.utcnow)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def _validators(key: Any, count: int, latest: Optional[datetime], top: Optional[int]) -> Validators:
+    stamp = latest.isoformat() if latest else ""
+    digest = hashlib.blake2b(repr((key, count, stamp, top)).encode(), digest_size=16).hexdigest()
+    return Validators(f'"{digest}"', latest, count)
+
+
+def collection_validators(session: Session, model, *where, key: Any = ()) -> Validators:
+    """Validators for the rows of `model` matching `where`; `key` names the representation."""
+    stmt = select(func.count(), func.max(model.updated_at), func.max(model.id)).select_from(model)
+    if where:
+        stmt = stmt.where(*where)
+    count, latest, top = session.exec(stmt).one()
+    return _validators((model.__tablename__, key), count, latest, top)
+
+
+def combined_validators(session: Session, *parts, key: Any = ()) -> Validators:
+    """One set of validators over several row sets; `parts` are (model, [where...]) pairs."""
+    columns = []
+    for model, where in parts:
+        for aggregate in (func.count(), func.max(model.updated_at), func.max(model.id)):
+            columns.append(select(aggregate).select_from(model).where(*where).scalar_subquery())
+    values = session.exec(select(*columns)).one()
+    sets = [tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
+    latest = max((s[1] for s in sets if s[1] is not None), default=None)
+    names = tuple(model.__tablename__ for model, _ in parts)
+    stamps = tuple((count, top, updated.isoformat() if updated else "") for count, updated, top in sets)
+    return _validators((names, stamps, key), sum(s[0] for s in sets), latest, None)
+
+
+def item_validators(session: Session, model, item_id: int, key: Any = ()) -> Optional[Validators]:
+    """Validators for one row, or None if it doesn't exist."""
+    # selecting the id too keeps every row a tuple (one column would come back as a scalar)
+    columns = [model.id, model.updated_at] + ([model.views] if hasattr(model, "views") else [])
+    row = session.exec(select(*columns).where(model.id == item_id)).first()
+    if row is None:
+        return None
+    _, latest, *views = row
+    return _validators((model.__tablename__, item_id, key, *views), 1, latest, item_id)
+
+
+def _etags(header: str) -> set[str]:
+    # weak comparison (RFC 9110 13.1.2): W/"x" matches "x"
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def is_fresh(request: Request, v: Validators) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etags(if_none_match)
+        return "*" in tags or v.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and v.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        modified = v.last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        return modified <= since
+    return False
+
+
+def check(request: Request, response: Response, v: Optional[Validators]) -> Optional[Response]:
+    """Put the validators on `response`; return a 304 if the client's copy is current."""
+    if v is None:
+        return None
+    headers = v.headers()
+    response.headers.update(headers)
+    if is_fresh(request, v):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def cached(
+    request: Request,
+    response: Response,
+    cache,
+    key: Hashable,
+    validators: Callable[[], Optional[Validators]],
+    load: Callable[[], Any],
+) -> Tuple[Optional[Response], Optional[Validators], Any]:
+    """(304 or None, validators, body) for `key`, from `cache` or computed now and cached together.
+
+    On a miss the validators are computed before the body, so a write landing
+    in between pairs an older tag with a newer body (the next request gets a
+    new tag), never the reverse. A miss that ends in a 304 loads no body.
+    """
+    found, entry = cache.get(key)
+    if found:
+        v, body = entry
+        return check(request, response, v), v, body
+
+    gen = cache.generation
+    v = validators()
+    if (not_modified := check(request, response, v)) is not None:
+        return not_modified, v, None
+    body = load()
+    cache.set(key, (v, body), gen)
+    return None, v, body
@@ -0,0 +1,357 @@
+"""Write-time content pipeline for posts.
+
+`process()` runs once when a post body is created or changed (create/update
+routes, bulk import, backfill) and produces everything reads need, so no
+read does text processing:
+
+- `content_html`: the body rendered and sanitized. HTML bodies are filtered
+  against an allowlist of tags, attributes and URL schemes. Plain-text bodies
+  get a small Markdown subset (`#` headings, `-` lists, **bold**, *italic*,
+  `code`, [links](url)) and paragraphs.
+- `toc`: `[{"level", "id", "text"}]` for the h1-h4 headings, which also get
+  unique `id` anchors in `content_html`
+- `read_time`: minutes at WORDS_PER_MINUTE, at least 1
+- `excerpt`: the first ~EXCERPT_CHARS characters of the text, used when the
+  author didn't write one (`excerpt_auto` marks it, so later edits refresh it).
+  It is plain text, like an authored excerpt, and templates escape it: the
+  text was decoded from the body, so `&lt;script&gt;` in a post is
+  `<script>` here and must never be marked safe.
+
+URLs in `href`/`src` are kept only with an allowed scheme or as site-relative
+(`/`, `#`, `?`), after removing the whitespace and control characters
+browsers ignore inside URLs.
+
+Backfill rows written before the pipeline existed (or re-render everything
+after changing it):
+
+    python content.py backfill [--force]
+"""
+from __future__ import annotations
+
+import html
+import math
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import List, Optional
+
+WORDS_PER_MINUTE = 200
+EXCERPT_CHARS = 160
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "code", "del", "em", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "mark", "ol", "p", "pre",
+    "s", "small", "strong", "sub", "sup", "table", "tbody", "td", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRS = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+URL_ATTRS = {"href", "src"}
+SAFE_SCHEMES = {"http", "https", "mailto"}
+# dropped together with everything inside them
+DROP_CONTENT = {"script", "style", "iframe", "object", "embed", "template", "noscript", "svg", "math"}
+VOID_TAGS = {"br", "hr", "img"}
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+TOC_LEVELS = {1, 2, 3, 4}
+BLOCK_TAGS = {"p", "li", "blockquote", "pre", "td", "th", "figcaption", "br", "hr"} | HEADINGS
+
+_HTML_HINT = re.compile(r"<(?:p|div|span|h[1-6]|ul|ol|li|br|hr|strong|em|b|i|a|img|blockquote|pre|code|table)\b", re.I)
+_SCHEME = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+# browsers drop these anywhere in a URL ("java\tscript:" is "javascript:")
+_URL_IGNORED = re.compile(r"[\x00-\x20\x7f]+")
+RELATIVE_PREFIXES = ("/", "#", "?")
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Processed:
+    content_html: str
+    toc: List[dict] = field(default_factory=list)
+    read_time: int = 1
+    excerpt: str = ""
+
+
+# ----------------------------------------
+# Sanitizing
+# ----------------------------------------
+def _safe_url(value: str) -> Optional[str]:
+    """The URL as browsers will read it, or None unless it has a safe scheme or is site-relative."""
+    url = _URL_IGNORED.sub("", value)
+    m = _SCHEME.match(url)
+    if m is not None:
+        return url if m.group(1).lower() in SAFE_SCHEMES else None
+    return url if url.startswith(RELATIVE_PREFIXES) else None
+
+
+def _anchor(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "section"
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.text: List[str] = []
+        self.body_text: List[str] = []  # text outside headings, for the excerpt
+        self.toc: List[dict] = []
+        self._open: List[str] = []
+        self._drop = 0
+        self._heading: Optional[tuple] = None  # (tag, index in out, text parts)
+        self._anchors: set = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT:
+            self._drop += 1
+            return
+        if self._drop or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRS.get(tag, set())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS:
+                value = _safe_url(value)
+                if value is None:
+                    continue
+            kept.append(f' {name}="{html.escape(value, quote=True)}"')
+        if tag == "a" and any(a.startswith(' href="http') for a in kept):
+            kept.append(' rel="nofollow noopener"')
+        if tag == "img" and not any(a.startswith(" src=") for a in kept):
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+            self.body_text.append(" ")
+        if tag in HEADINGS and self._heading is None:
+            self._heading = (tag, len(self.out), [])
+            self.out.append("")  # filled in with the anchor at the end tag
+        else:
+            self.out.append(f"<{tag}{''.join(kept)}>")
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and not self._drop and tag in ALLOWED_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT:
+            self._drop = max(0, self._drop - 1)
+            return
+        if self._drop or tag not in self._open:
+            return
+        while self._open:
+            open_tag = self._open.pop()
+            self._close(open_tag)
+            if open_tag == tag:
+                break
+
+    def _close(self, tag: str) -> None:
+        if self._heading is not None and tag == self._heading[0]:
+            _, index, parts = self._heading
+            text = " ".join("".join(parts).split())
+            anchor = base = _anchor(text)
+            n = 2
+            while anchor in self._anchors:
+                anchor, n = f"{base}-{n}", n + 1
+            self._anchors.add(anchor)
+            self.out[index] = f'<{tag} id="{anchor}">'
+            level = int(tag[1])
+            if level in TOC_LEVELS and text:
+                self.toc.append({"level": level, "id": anchor, "text": text})
+            self._heading = None
+        self.out.append(f"</{tag}>")
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+            self.body_text.append(" ")
+
+    def handle_data(self, data):
+        if self._drop:
+            return
+        self.out.append(html.escape(data, quote=False))
+        self.text.append(data)
+        if self._heading is not None:
+            self._heading[2].append(data)
+        else:
+            self.body_text.append(data)
+
+    def close(self):
+        super().close()
+        while self._open:
+            self._close(self._open.pop())
+
+
+# ----------------------------------------
+# Plain text -> HTML
+# ----------------------------------------
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_LIST_ITEM = re.compile(r"^\s*[-*]\s+")
+_INLINE = [
+    (re.compile(r"`([^`]+)`"), r"<code>\1</code>"),
+    (re.compile(r"\*\*(.+?)\*\*"), r"<strong>\1</strong>"),
+    (re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])"), r"<em>\1</em>"),
+    # the URL may hold one level of balanced parentheses: wiki/Foo_(bar), javascript:alert(1)
+    (re.compile(r"\[([^\]]+)\]\(((?:[^()\s]|\([^()\s]*\))+)\)"), r'<a href="\2">\1</a>'),
+]
+
+
+def _inline(text: str) -> str:
+    text = html.escape(text, quote=True)
+    for pattern, repl in _INLINE:
+        text = pattern.sub(repl, text)
+    return text
+
+
+def _block(lines: List[str]) -> str:
+    if all(_LIST_ITEM.match(line) for line in lines):
+        return "<ul>" + "".join(f"<li>{_inline(_LIST_ITEM.sub('', line))}</li>" for line in lines) + "</ul>"
+    return "<p>" + "<br>".join(_inline(line) for line in lines) + "</p>"
+
+
+def text_to_html(text: str) -> str:
+    out = []
+    for block in re.split(r"\n\s*\n", text.replace("\r\n", "\n").strip()):
+        lines: List[str] = []
+        for line in block.split("\n"):
+            m = _HEADING.match(line)
+            if m:  # a heading line ends the paragraph / list before it
+                if lines:
+                    out.append(_block(lines))
+                    lines = []
+                level = len(m.group(1))
+                out.append(f"<h{level}>{_inline(m.group(2).strip())}</h{level}>")
+            elif line.strip():
+                lines.append(line.rstrip())
+        if lines:
+            out.append(_block(lines))
+    return "\n".join(out)
+
+
+# ----------------------------------------
+# Pipeline
+# ----------------------------------------
+def make_excerpt(text: str, limit: int = EXCERPT_CHARS) -> str:
+    """The first `limit` characters of decoded `text`, as plain text (like an authored excerpt)."""
+    text = " ".join(text.split())
+    if len(text) > limit:
+        cut = text[:limit]
+        if " " in cut:
+            cut = cut[: cut.rindex(" ")]
+        text = cut.rstrip(" ,.;:-") + "…"
+    return text
+
+
+def process(content: Optional[str]) -> Processed:
+    content = content or ""
+    source = content if _HTML_HINT.search(content) else text_to_html(content)
+    parser = _Sanitizer()
+    parser.feed(source)
+    parser.close()
+    words = len(_WORD.findall("".join(parser.text)))
+    return Processed(
+        content_html="".join(parser.out),
+        toc=parser.toc,
+        read_time=max(1, math.ceil(words / WORDS_PER_MINUTE)),
+        excerpt=make_excerpt("".join(parser.body_text)),
+    )
+
+
+def apply(post, content_changed: bool = True, excerpt: Optional[str] = None) -> None:
+    """Update a Post's derived fields in place.
+
+    `excerpt` is what the author sent: None keeps the current one (refreshing
+    it if it was generated), "" asks for a generated one, anything else is
+    used as-is.
+    """
+    if excerpt is not None:
+        post.excerpt = excerpt.strip() or None
+        post.excerpt_auto = post.excerpt is None
+    if content_changed or post.content_html is None:
+        done = process(post.content)
+        post.content_html = done.content_html
+        post.toc = done.toc
+        post.read_time = done.read_time
+    else:
+        done = None
+    if not post.excerpt or post.excerpt_auto:
+        post.excerpt = (done or process(post.content)).excerpt or None
+        post.excerpt_auto = True
+
+
+def reprocess(conn, force: bool = False, batch_size: int = 500) -> int:
+    """Re-run `process()` for stored posts (unprocessed ones, or all with `force`); returns how many.
+
+    Runs on the caller's Connection, so a migration can use it inside its transaction.
+    """
+    from datetime import datetime
+
+    from sqlalchemy import bindparam, select, update
+
+    from route.model import Post
+
+    stmt = select(Post.id, Post.content, Post.excerpt, Post.excerpt_auto)
+    if not force:
+        stmt = stmt.where(Post.content_html.is_(None))
+    table = Post.__table__
+    write = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(
+            content_html=bindparam("content_html"),
+            toc=bindparam("toc"),
+            read_time=bindparam("read_time"),
+            excerpt=bindparam("excerpt"),
+            excerpt_auto=bindparam("excerpt_auto"),
+            updated_at=bindparam("updated_at"),
+        )
+    )
+    rows = conn.execute(stmt).all()
+    now = datetime.utcnow()
+    for start in range(0, len(rows), batch_size):
+        params = []
+        for row in rows[start:start + batch_size]:
+            done = process(row.content)
+            auto = not row.excerpt or bool(row.excerpt_auto)
+            params.append({
+                "_id": row.id,
+                "content_html": done.content_html,
+                "toc": done.toc,
+                "read_time": done.read_time,
+                "excerpt": (done.excerpt or None) if auto else row.excerpt,
+                "excerpt_auto": auto,
+                # rendered output changed: let ETags, page fragments and exports notice
+                "updated_at": now,
+            })
+        conn.execute(write, params)
+    return len(rows)
+
+
+def backfill(force: bool = False, batch_size: int = 500) -> dict:
+    """Fill content_html / toc / read_time / generated excerpts for existing rows."""
+    from cache import invalidate_all
+    from database import engine, init_db
+
+    init_db()
+    with engine.begin() as conn:
+        updated = reprocess(conn, force, batch_size)
+    if updated:
+        invalidate_all()
+    return {"scanned": updated, "updated": updated}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Post content pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("backfill", help="render content_html / toc / read_time / excerpts for stored posts")
+    cmd.add_argument("--force", action="store_true", help="re-process every post, not just unprocessed ones")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        result = backfill(force=args.force)
+        print(f"{result['updated']} posts processed")
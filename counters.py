@@ -0,0 +1,104 @@
+"""Denormalized post counters on categories: `post_count` and `active_post_count`.
+
+Category listings show these counts, and the delete check reads them,
+without scanning `posts`. The post write routes keep the counters current
+inside their own transaction. They build the statements with
+`updates(old, new)`, where `old` and `new` are the post's (category_id,
+status) before and after the write, or None for a post being created or
+deleted. Each is an atomic `count = count + delta` UPDATE, so concurrent
+writers don't lose increments. A changed count also bumps the category's
+`updated_at`, which moves the category ETags (conditional.py).
+
+Writes that bypass the routes (the bulk import, manual SQL) recount the
+categories they touch with `recount()`, which can also repair drift from
+the command line:
+
+    python counters.py recount           # fix every category whose counts are off
+    python counters.py recount --check   # only report them; exit status 1 if any
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.engine import Connection
+
+from route.model import Category, Post
+
+ACTIVE = "active"
+
+State = Optional[Tuple[Optional[int], str]]  # (category_id, status) of a post, None if absent
+
+
+def deltas(old: State, new: State) -> Dict[int, Tuple[int, int]]:
+    """category_id -> (post_count delta, active_post_count delta) for one post write."""
+    changes: Dict[int, List[int]] = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None or not state[0]:  # no such post, or no category
+            continue
+        d = changes.setdefault(state[0], [0, 0])
+        d[0] += sign
+        if state[1] == ACTIVE:
+            d[1] += sign
+    return {cat: (total, active) for cat, (total, active) in changes.items() if total or active}
+
+
+def updates(old: State, new: State) -> list:
+    """UPDATE statements applying `deltas(old, new)`; run them in the post write's transaction."""
+    now = datetime.utcnow()
+    return [
+        update(Category)
+        .where(Category.id == cat)
+        .values(
+            post_count=Category.post_count + total,
+            active_post_count=Category.active_post_count + active,
+            updated_at=now,
+        )
+        for cat, (total, active) in deltas(old, new).items()
+    ]
+
+
+def recount(conn: Connection, category_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute the counters from `posts` (all categories, or `category_ids`); returns how many were off."""
+    total = select(func.count(Post.id)).where(Post.category_id == Category.id).scalar_subquery()
+    active = (
+        select(func.count(Post.id))
+        .where(Post.category_id == Category.id, Post.status == ACTIVE)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Category)
+        .where(or_(Category.post_count != total, Category.active_post_count != active))
+        .values(post_count=total, active_post_count=active, updated_at=datetime.utcnow())
+    )
+    if category_ids is not None:
+        stmt = stmt.where(Category.id.in_(set(category_ids)))
+    return conn.execute(stmt).rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from cache import invalidate_all
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Category post counters")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("recount", help="recompute post_count / active_post_count from posts")
+    p.add_argument("--check", action="store_true", help="report categories that are off, change nothing")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        off = recount(conn)
+        if args.check:
+            conn.rollback()
+        else:
+            conn.commit()
+    if args.check:
+        print(f"{off} categor{'y' if off == 1 else 'ies'} with wrong counts")
+        sys.exit(1 if off else 0)
+    if off:
+        invalidate_all()  # running workers may have cached the old counts
+    print(f"{off} categor{'y' if off == 1 else 'ies'} repaired")
@@ -2,13 +2,18 @@
 
 Usage in your `main.py`:
 
+    from contextlib import asynccontextmanager
     from fastapi import FastAPI
     from database import init_db
     from categories import router as categories_router
     from posts import router as posts_router
 
-    app = FastAPI()
-    init_db()  # create tables if not present
+    @asynccontextmanager
+    async def lifespan(app):
+        init_db()  # apply pending schema migrations (see migrations.py)
+        yield
+
+    app = FastAPI(lifespan=lifespan)
     app.include_router(categories_router)
     app.include_router(posts_router)
 
@@ -16,35 +21,235 @@ In your routers (`categories.py`, `posts.py`), import the shared session:
 
     from database import get_session
 
+`async def` routes must not use `get_session` (every query and commit would
+block the event loop); they take the async session instead:
+
+    from database import get_async_session
+
+Plain `def` routes keep the sync session; FastAPI runs them in its threadpool.
+
 Environment:
-- DATABASE_URL  -> full SQLAlchemy URL (e.g. "sqlite:///./wowblog.db")
-- WOWBLOG_DB    -> path to SQLite file (used only if DATABASE_URL not set)
-- SQL_ECHO      -> set to any non-empty value to enable SQL echo logs
+- DATABASE_URL        -> full SQLAlchemy URL (e.g. "sqlite:///./wowblog.db")
+- WOWBLOG_DB          -> path to SQLite file (used only if DATABASE_URL not set)
+- ASYNC_DATABASE_URL  -> async driver URL; derived from DATABASE_URL for SQLite
+                         ("sqlite+aiosqlite:///...") when not set
+- SQL_ECHO            -> set to any non-empty value to enable SQL echo logs
+
+Connection pool:
+- DB_POOL_SIZE        -> pooled connections per engine (default 5)
+- DB_MAX_OVERFLOW     -> extra connections allowed under burst (default 10)
+- DB_POOL_TIMEOUT     -> seconds to wait for a free connection (default 30)
+- DB_READ_WRITE_SPLIT -> "1" to serve reads from a separate read-only pool
+                         (`get_read_session`) and serialize all writes through
+                         one writer at a time (SQLite file databases only)
+
+With the split on, the sync `engine` and `async_engine` share `writer_lock`:
+a connection of either holds it from checkout to checkin, so the process has
+a single writer. It is re-entrant per owner (a thread, or an asyncio task),
+because an async write route can open a second session while holding its
+own (storage.py's media index, during an upload). Async checkouts wait for it
+on a worker thread, never on the event loop.
+
+SQLite profile (PRAGMAs run on every new connection):
+- SQLITE_JOURNAL_MODE     -> default WAL (readers don't block the writer)
+- SQLITE_SYNCHRONOUS      -> default NORMAL (safe with WAL, far fewer fsyncs)
+- SQLITE_BUSY_TIMEOUT_MS  -> wait this long on a locked DB before failing (5000)
+- SQLITE_MMAP_SIZE        -> bytes of the DB file to memory-map (256 MiB)
+- SQLITE_CACHE_SIZE       -> page cache; negative values are KiB (-64000)
+- SQLITE_TEMP_STORE       -> default MEMORY
 """
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
 from pathlib import Path
-from typing import Iterator
+from typing import AsyncIterator, Hashable, Iterator, Optional
 
-from sqlmodel import SQLModel, Session, create_engine
+import anyio.to_thread
+from sqlalchemy import event, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import await_only
+from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # ----------------------------------------
 # URL / Engine
 # ----------------------------------------
 BASE_DIR = Path(__file__).resolve().parent
-DEFAULT_DB_PATH = BASE_DIR / "wowblog.db"
+DEFAULT_DB_PATH = Path(os.getenv("WOWBLOG_DB") or BASE_DIR / "wowblog.db")
 DATABASE_URL = os.getenv("DATABASE_URL") or f"sqlite:///{DEFAULT_DB_PATH}"
+SQL_ECHO = bool(os.getenv("SQL_ECHO"))
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+# Connection pool (file-backed databases)
+POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)
+
+# SQLite profile, applied to every new connection
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "cache_size": _env_int("SQLITE_CACHE_SIZE", -64000),  # negative = KiB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+_url = make_url(DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+_IS_MEMORY = IS_SQLITE and _url.database in (None, "", ":memory:")
+
+# Separate read-only pool + a single serialized writer connection.
+READ_WRITE_SPLIT = IS_SQLITE and not _IS_MEMORY and _env_flag("DB_READ_WRITE_SPLIT")
+
+
+def _apply_pragmas(engine, read_only: bool = False) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if read_only and name == "journal_mode":
+                continue  # persistent, set by the writer; a read-only handle can't change it
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _pool_args(writer: bool, poolclass, shared_lock: bool = False) -> dict:
+    if _IS_MEMORY:
+        return {}
+    if writer and READ_WRITE_SPLIT:
+        # SQLite allows one writer at a time: queue writers on our side instead
+        # of letting them spin on the database lock. With `shared_lock` the
+        # queue is writer_lock, and the pool must not cap connections: a
+        # lock owner opening a nested session can't wait for a connection
+        # held by someone waiting for the lock.
+        if shared_lock:
+            return {"poolclass": poolclass, "pool_size": 2, "max_overflow": -1}
+        return {"poolclass": poolclass, "pool_size": 1, "max_overflow": 0, "pool_timeout": POOL_TIMEOUT}
+    return {"poolclass": poolclass, "pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "pool_timeout": POOL_TIMEOUT}
+
+
+# ----------------------------------------
+# Single writer (DB_READ_WRITE_SPLIT)
+# ----------------------------------------
+class WriterLock:
+    """A lock owned by a thread or an asyncio task, re-entrant for its owner."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._owner: Optional[Hashable] = None
+        self._depth = 0
+
+    def acquire(self, owner: Hashable, blocking: bool = True) -> bool:
+        with self._cond:
+            while self._owner not in (None, owner):
+                if not blocking:
+                    return False
+                self._cond.wait()
+            self._owner = owner
+            self._depth += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+
+writer_lock = WriterLock()
+
+
+def _serialize_writes(sync_engine, is_async: bool) -> None:
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        if is_async:
+            # inside SQLAlchemy's greenlet, on the event loop: wait off-loop
+            owner = ("task", id(asyncio.current_task()))
+            if not writer_lock.acquire(owner, blocking=False):
+                acquired = []
+
+                def wait() -> None:
+                    writer_lock.acquire(owner)
+                    acquired.append(True)
+
+                try:
+                    await_only(anyio.to_thread.run_sync(wait))
+                except BaseException:  # cancelled: the thread may have got it anyway
+                    if acquired:
+                        writer_lock.release()
+                    raise
+        else:
+            writer_lock.acquire(("thread", threading.get_ident()))
+        connection_record.info["writer_lock"] = True
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        if connection_record.info.pop("writer_lock", False):
+            writer_lock.release()
+
 
 # For SQLite + FastAPI concurrency we need check_same_thread=False
-_connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+_connect_args = {"check_same_thread": False} if IS_SQLITE else {}
 
 engine = create_engine(
     DATABASE_URL,
-    echo=bool(os.getenv("SQL_ECHO")),
+    echo=SQL_ECHO,
     connect_args=_connect_args,
+    **_pool_args(writer=True, poolclass=QueuePool),
+)
+
+if READ_WRITE_SPLIT:
+    read_engine = create_engine(
+        f"sqlite:///file:{_url.database}?mode=ro&uri=true",
+        echo=SQL_ECHO,
+        connect_args=_connect_args,
+        **_pool_args(writer=False, poolclass=QueuePool),
+    )
+else:
+    read_engine = engine
+
+
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=SQL_ECHO,
+    **_pool_args(writer=True, poolclass=AsyncAdaptedQueuePool, shared_lock=True),
 )
 
+if IS_SQLITE:
+    _apply_pragmas(engine)
+    _apply_pragmas(async_engine.sync_engine)
+    if read_engine is not engine:
+        _apply_pragmas(read_engine, read_only=True)
+
+if READ_WRITE_SPLIT:
+    _serialize_writes(engine, is_async=False)
+    _serialize_writes(async_engine.sync_engine, is_async=True)
+
 
 # ----------------------------------------
 # Session dependency
@@ -55,17 +260,36 @@ def get_session() -> Iterator[Session]:
         yield session
 
 
+def get_read_session() -> Iterator[Session]:
+    """Like `get_session`, but on the read-only pool when DB_READ_WRITE_SPLIT is on.
+
+    Use it for routes that never write.
+    """
+    with Session(read_engine) as session:
+        yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Yield an AsyncSession for `async def` routes.
+
+    expire_on_commit=False: attributes stay loaded after commit, since an
+    async session cannot lazy-load them again during response serialization.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 # ----------------------------------------
-# Init (create tables)
+# Init (schema migrations)
 # ----------------------------------------
 def init_db() -> None:
-    """Create all tables if they don't exist.
+    """Bring the schema up to date (migrations.py) and detect the search index.
 
-    We import models inside to ensure SQLModel sees all table classes before
-    creating metadata.
+    Cheap when the database is already current: a version lookup, no
+    reflection or DDL.
     """
-    # Import models so SQLModel.metadata is populated
-    from route import model  # ✅ This matches your actual folder structure
-
+    from migrations import migrate
+    from search import detect_fts
 
-    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    detect_fts(engine)
@@ -0,0 +1,289 @@
+"""Static-site export of the public blog.
+
+Pre-renders the pages served by route/pages.py into plain files, with the
+same templates and URLs, so a spike can be served straight from disk or a CDN:
+
+    <out>/blog/index.html                    home
+    <out>/blog/<slug>/index.html             every active post
+    <out>/blog/category/<slug>/index.html    every category
+
+Uploaded files are linked as /uploads/... and are not copied.
+
+Runs are incremental. If a few aggregates (row counts, max updated_at, total
+views, template sources) are unchanged since the last run, there is nothing
+to do. Otherwise all post metadata (never bodies) is read in one query,
+and each page gets a key: a hash of the data it shows, the shared nav/hero
+HTML and the template sources. `<out>/.manifest.json` records the key and
+the SHA-256 of every written page. A re-run renders only pages whose key
+changed (or whose file is missing) and deletes pages that no longer exist.
+A rendered page whose bytes are unchanged is not rewritten.
+
+Rendering runs in a process pool; each worker loads the bodies of the posts
+it renders itself. Small batches are rendered inline, since starting the
+pool would cost more than the work.
+
+    python export.py [--out site] [--workers N] [--force]
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
+
+BASE_DIR = Path(__file__).resolve().parent
+TEMPLATES_DIR = BASE_DIR / "templates"
+DEFAULT_OUT = BASE_DIR / "site"
+MANIFEST = ".manifest.json"
+
+# below this many pages, rendering inline beats starting worker processes
+POOL_THRESHOLD = 64
+
+_env: Optional[Environment] = None
+_content_conn = None
+
+
+# ----------------------------------------
+# Rendering (runs in worker processes)
+# ----------------------------------------
+def _jinja() -> Environment:
+    global _env
+    if _env is None:
+        from images import srcset
+
+        _env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)), autoescape=True)
+        _env.globals["srcset"] = srcset
+    return _env
+
+
+def _render(name: str, **context) -> str:
+    return _jinja().get_template(name).render(**context)
+
+
+def _content(post_id: int) -> Tuple[Optional[str], Optional[list]]:
+    global _content_conn
+    if _content_conn is None:
+        from database import read_engine
+
+        _content_conn = read_engine.connect()
+    from sqlalchemy import text
+
+    row = _content_conn.execute(
+        text("SELECT content_html, toc FROM posts WHERE id = :id"), {"id": post_id}
+    ).first()
+    if row is None:
+        return None, None
+    return row.content_html, json.loads(row.toc) if row.toc else None
+
+
+def _cards(rows: Iterable) -> List[Markup]:
+    return [Markup(_render("partials/post_card.html", post=row)) for row in rows]
+
+
+def _write(path: Path, html: str, old_sha: Optional[str]) -> Tuple[str, bool]:
+    data = html.encode()
+    sha = hashlib.sha256(data).hexdigest()
+    if sha == old_sha and path.is_file():
+        return sha, False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return sha, True
+
+
+def render_page(job: tuple) -> Tuple[str, str, bool]:
+    """Render one page and write it if its bytes changed; returns (rel, sha256, written)."""
+    kind, rel, ctx, out_dir, old_sha = job
+    ctx = dict(ctx)
+    if kind == "post":
+        content_html, toc = _content(ctx["post_id"])
+        post = dict(ctx.pop("post")._mapping, content_html=content_html, toc=toc)
+        ctx["article"] = Markup(_render("partials/article.html", post=post))
+        ctx["related"] = _cards(ctx["related"])
+        html = _render("page.html", **ctx)
+    else:
+        ctx["cards"] = _cards(ctx["cards"])
+        html = _render("index.html", **ctx)
+    sha, written = _write(Path(out_dir) / rel, html, old_sha)
+    return rel, sha, written
+
+
+# ----------------------------------------
+# Planning (parent process)
+# ----------------------------------------
+def _fingerprint(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def _templates_hash() -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(TEMPLATES_DIR.rglob("*.html")):
+        digest.update(path.relative_to(TEMPLATES_DIR).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _sig(rows: Iterable) -> tuple:
+    # updated_at moves on every edit; views are shown on cards
+    return tuple((r.id, r.updated_at, r.views) for r in rows)
+
+
+def plan() -> Dict[str, Tuple[str, str, dict]]:
+    """rel path -> (kind, key, context) for every page of the site."""
+    from sqlmodel import Session, select
+
+    from database import read_engine
+    from route.model import Banner, Category, Post
+    from route.pages import CARD_COLUMNS, SITE_NAME, hero_context
+
+    with Session(read_engine) as session:
+        stmt = (
+            select(*CARD_COLUMNS, Post.category_id)
+            .where(Post.status == "active")
+            .order_by(Post.created_at.desc(), Post.id.desc())
+        )
+        posts = session.exec(stmt).all()
+        categories = session.exec(select(Category).order_by(Category.name)).all()
+        banner = session.exec(select(Banner).limit(1)).first()
+        nav = Markup(_render("partials/nav.html", categories=categories))
+        hero = Markup(_render("partials/hero.html", **hero_context(banner)))
+        category_heroes = {
+            c.id: Markup(_render(
+                "partials/hero.html",
+                heading=c.name, text=c.description, image=c.thumbnail_url, buttons=[],
+            ))
+            for c in categories
+        }
+
+    latest = posts[:5]
+    # what every page shows: templates, category nav, newest posts
+    shared = _fingerprint(_templates_hash(), str(nav), _sig(latest))
+    by_category: Dict[Optional[int], list] = {}
+    for p in posts:  # newest first
+        by_category.setdefault(p.category_id, []).append(p)
+
+    pages: Dict[str, Tuple[str, str, dict]] = {}
+
+    def add(kind: str, rel: str, ctx: dict, key: tuple) -> None:
+        pages[rel] = (kind, _fingerprint(shared, rel, key), ctx)
+
+    popular = sorted(posts, key=lambda p: (p.views, p.id), reverse=True)[:6]
+    add("listing", "blog/index.html", {
+        "title": SITE_NAME, "nav": nav, "hero": hero, "listing_title": "Most viewed",
+        "cards": popular, "latest": latest,
+    }, (str(hero), _sig(popular)))
+    for c in categories:
+        add("listing", f"blog/category/{c.slug}/index.html", {
+            "title": f"{c.name} – {SITE_NAME}", "nav": nav, "hero": category_heroes[c.id],
+            "listing_title": f"Posts in {c.name}", "cards": by_category.get(c.id, []), "latest": latest,
+        }, (str(category_heroes[c.id]), _sig(by_category.get(c.id, []))))
+    for p in posts:
+        siblings = [s for s in by_category[p.category_id][:5] if s is not p]
+        add("post", f"blog/{p.slug}/index.html", {
+            "title": f"{p.title} – {SITE_NAME}", "post_id": p.id, "nav": nav, "post": p,
+            "recommended": siblings[:4], "related": siblings[:3],
+        }, (_sig([p]), _sig(siblings[:4])))
+    return pages
+
+
+def site_signature() -> str:
+    """Aggregates that move whenever any page could change; one cheap query per table."""
+    from sqlalchemy import text
+
+    from database import read_engine
+
+    with read_engine.connect() as conn:
+        rows = [
+            tuple(conn.execute(text(sql)).one())
+            for sql in (
+                "SELECT count(*), max(updated_at), max(id), total(views) FROM posts WHERE status = 'active'",
+                "SELECT count(*), max(updated_at), max(id) FROM categories",
+                "SELECT count(*), max(updated_at) FROM banners",
+            )
+        ]
+    return _fingerprint(_templates_hash(), rows)
+
+
+def export(out_dir: Path = DEFAULT_OUT, workers: Optional[int] = None, force: bool = False) -> dict:
+    out_dir = Path(out_dir)
+    manifest_path = out_dir / MANIFEST
+    try:
+        saved = json.loads(manifest_path.read_text())
+        manifest, last_site = saved["pages"], saved["site"]
+    except (OSError, ValueError, KeyError, TypeError):
+        manifest, last_site = {}, None
+
+    site = site_signature()
+    if site == last_site and not force:
+        return {"pages": len(manifest), "rendered": 0, "written": 0, "deleted": 0}
+
+    pages = plan()
+    jobs = []
+    for rel, (kind, key, ctx) in pages.items():
+        old = manifest.get(rel)
+        if force or old is None or old["key"] != key or not (out_dir / rel).is_file():
+            jobs.append((kind, rel, ctx, str(out_dir), old and old["sha256"]))
+
+    stats = {"pages": len(pages), "rendered": len(jobs), "written": 0, "deleted": 0}
+    new_manifest = {rel: manifest[rel] for rel in pages if rel in manifest}
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) < POOL_THRESHOLD or workers == 1:
+        results = map(render_page, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = pool.map(render_page, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+    try:
+        for rel, sha, written in results:
+            new_manifest[rel] = {"key": pages[rel][1], "sha256": sha}
+            stats["written"] += written
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for rel in manifest.keys() - pages.keys():
+        path = out_dir / rel
+        path.unlink(missing_ok=True)
+        stats["deleted"] += 1
+        for parent in path.parents:
+            if parent == out_dir:
+                break
+            try:
+                parent.rmdir()  # only succeeds once empty
+            except OSError:
+                break
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_path.with_name(MANIFEST + ".tmp")
+    tmp.write_text(json.dumps({"site": site, "pages": new_manifest}, separators=(",", ":")))
+    os.replace(tmp, manifest_path)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Export the public blog as static files")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="output directory (default: site/)")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render every page")
+    parser.add_argument("--clean", action="store_true", help="empty the output directory first")
+    args = parser.parse_args()
+
+    if args.clean and args.out.exists():
+        shutil.rmtree(args.out)
+    t0 = time.perf_counter()
+    result = export(args.out, workers=args.workers, force=args.force)
+    print(
+        f"{result['pages']} pages: {result['rendered']} rendered, {result['written']} written, "
+        f"{result['deleted']} deleted in {time.perf_counter() - t0:.2f}s"
+    )
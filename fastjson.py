@@ -0,0 +1,73 @@
+"""Fast JSON path for the read endpoints.
+
+The list/get routes used to load ORM objects, validate them into their
+`*Read` schemas and then have FastAPI re-validate and encode them against
+`response_model`. For large listings that object work cost far more than the
+SQLite query did. Instead, those routes now select plain columns, turn each
+row into a dict (`rows_to_dicts`), encode it once with `dumps` and cache the
+encoded bytes. `FastJSONResponse` sends bytes as they are, so cache hits
+do no serialization at all. `response_model` stays on the routes for the
+OpenAPI schema, but it isn't applied to a returned Response: the rows come
+from our own tables, so there is nothing to validate.
+
+The output is byte-for-byte what FastAPI's JSONResponse gives for the schema
+models: the same key order (field order, then computed fields), compact
+separators, UTF-8 without escaping and ISO 8601 datetimes. orjson is used when
+installed, and otherwise `json.dumps` with FastAPI's settings produces the
+same bytes.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+    import json
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response whose content may already be encoded (bytes from the cache)."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def rows_to_dicts(
+    rows: Iterable[Sequence[Any]],
+    names: List[str],
+    computed: Optional[Dict[str, tuple[str, Callable[[Any], Any]]]] = None,
+) -> List[dict]:
+    """Rows selected as `names` (extra trailing columns ignored) -> dicts.
+
+    `computed` maps an output key to (source column, function), for the
+    schemas' computed fields, which are appended after the columns.
+    """
+    computed = {k: (names.index(src), fn) for k, (src, fn) in (computed or {}).items() if src in names}
+    if not computed:
+        return [dict(zip(names, row)) for row in rows]
+    out = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for key, (i, fn) in computed.items():
+            item[key] = fn(row[i])
+        out.append(item)
+    return out
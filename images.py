@@ -0,0 +1,247 @@
+"""Resized / modern-format derivatives of uploaded images.
+
+For every raster image under uploads/<bucket>/ we publish variants at a set of
+widths and formats:
+
+    /uploads/<bucket>/<name>                    original
+    /uploads/_variants/<bucket>/<name>.<w>w.<fmt>   derivative
+
+Resizing is CPU-bound, so it runs in a ProcessPoolExecutor, never on the
+request path:
+
+- after an upload, `schedule()` queues all variants of the new file
+- a request for a variant that doesn't exist yet builds just that one
+  (`ensure_variant()`, awaited by the /uploads/_variants route)
+
+A failed build (encoder error, a worker killed, a broken pool) is logged. A
+variant request that can't be built is answered with the original image,
+uncached, so a srcset never points at a 404; a broken pool is replaced on
+the next build.
+
+Read schemas expose `srcset()` strings for cover/thumbnail/banner URLs.
+
+Pillow is optional: without it (or with IMAGE_VARIANTS=0) no srcsets are
+advertised and originals are served as before.
+
+Environment:
+- IMAGE_VARIANTS  -> "0" to disable derivatives
+- IMAGE_WIDTHS    -> comma-separated widths (default "320,640,1280")
+- IMAGE_FORMATS   -> comma-separated formats (default "webp,avif"; formats the
+                     installed Pillow can't encode are dropped). The first
+                     one is used for srcset.
+- IMAGE_WORKERS   -> process pool size (default: min(4, CPU count))
+
+Backfill existing files:
+
+    python images.py backfill [--force]
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+UPLOADS_DIR = BASE_DIR / "uploads"
+VARIANTS_DIR = UPLOADS_DIR / "_variants"
+
+SOURCE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+WIDTHS = sorted({int(w) for w in (os.getenv("IMAGE_WIDTHS") or "320,640,1280").split(",") if w.strip()})
+_QUALITY = {"webp": 80, "avif": 60}
+_MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def _supported(fmt: str) -> bool:
+    return Image is not None and fmt in _QUALITY and features.check(fmt)
+
+
+FORMATS = [
+    f for f in (x.strip().lower() for x in (os.getenv("IMAGE_FORMATS") or "webp,avif").split(","))
+    if f and _supported(f)
+]
+ENABLED = Image is not None and bool(WIDTHS) and bool(FORMATS) and os.getenv("IMAGE_VARIANTS", "1") != "0"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ----------------------------------------
+# Naming
+# ----------------------------------------
+def _source_rel(url: Optional[str]) -> Optional[str]:
+    """'/uploads/banner/a.png' -> 'banner/a.png' if it is a resizable upload."""
+    if not url or not url.startswith("/uploads/"):
+        return None
+    rel = url[len("/uploads/"):]
+    bucket, _, name = rel.partition("/")
+    if not name or "/" in name or bucket.startswith(("_", ".")):
+        return None
+    if Path(name).suffix.lower() not in SOURCE_EXTS:
+        return None
+    return rel
+
+
+def variant_rel(source_rel: str, width: int, fmt: str) -> str:
+    return f"{source_rel}.{width}w.{fmt}"
+
+
+def parse_variant(rel: str) -> Optional[tuple[str, int, str]]:
+    """'banner/a.png.640w.webp' -> ('banner/a.png', 640, 'webp')."""
+    try:
+        stem, width, fmt = rel.rsplit(".", 2)
+        width = int(width.removesuffix("w"))
+    except ValueError:
+        return None
+    if width not in WIDTHS or fmt not in FORMATS or _source_rel(f"/uploads/{stem}") is None:
+        return None
+    return stem, width, fmt
+
+
+def media_type(fmt: str) -> str:
+    return _MEDIA_TYPES[fmt]
+
+
+def srcset(url: Optional[str]) -> Optional[str]:
+    """srcset for an uploaded image URL, in the preferred format; None if n/a."""
+    rel = _source_rel(url) if ENABLED else None
+    if rel is None:
+        return None
+    fmt = FORMATS[0]
+    return ", ".join(f"/uploads/_variants/{variant_rel(rel, w, fmt)} {w}w" for w in WIDTHS)
+
+
+# ----------------------------------------
+# Rendering (runs in worker processes)
+# ----------------------------------------
+def _render(im, width: int, fmt: str, dest: Path) -> None:
+    if im.width > width:
+        im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+    if im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA" if "A" in im.getbands() or im.mode == "P" else "RGB")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    im.save(tmp, format=fmt.upper(), quality=_QUALITY[fmt])
+    os.replace(tmp, dest)
+
+
+def build_variants(
+    source_rel: str,
+    widths: Optional[Iterable[int]] = None,
+    formats: Optional[Iterable[str]] = None,
+    force: bool = False,
+) -> List[str]:
+    """Write missing variants of uploads/<source_rel>; returns the ones written."""
+    src = UPLOADS_DIR / source_rel
+    todo = [
+        (w, f, VARIANTS_DIR / variant_rel(source_rel, w, f))
+        for f in (formats or FORMATS)
+        for w in (widths or WIDTHS)
+    ]
+    todo = [t for t in todo if force or not t[2].exists()]
+    if not todo or not src.is_file():
+        return []
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.load()
+        for width, fmt, dest in todo:
+            _render(im, width, fmt, dest)
+    return [variant_rel(source_rel, w, f) for w, f, _ in todo]
+
+
+# ----------------------------------------
+# Scheduling (called from the app)
+# ----------------------------------------
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        workers = int(os.getenv("IMAGE_WORKERS") or min(4, os.cpu_count() or 1))
+        # spawn: forking a process that runs an event loop + threadpool is unsafe
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _failed(source_rel: str, exc: BaseException) -> None:
+    log.error("building image variants of %s failed", source_rel, exc_info=exc)
+    if isinstance(exc, BrokenProcessPool):
+        shutdown()  # a worker died (e.g. OOM on a huge image); start fresh next time
+
+
+def schedule(url: str) -> None:
+    """Queue all variants of a freshly uploaded file (fire-and-forget; failures are logged)."""
+    rel = _source_rel(url) if ENABLED else None
+    if rel is None:
+        return
+
+    def done(fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            _failed(rel, fut.exception())
+
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(_executor(), build_variants, rel)
+    except BrokenProcessPool as exc:
+        _failed(rel, exc)
+        return
+    fut.add_done_callback(done)
+
+
+async def ensure_variant(rel: str) -> Optional[Path]:
+    """Path of the variant `rel`, building it first if needed; None if invalid.
+
+    If it can't be built, the path of the original image instead.
+    """
+    parsed = parse_variant(rel) if ENABLED else None
+    if parsed is None:
+        return None
+    source_rel, width, fmt = parsed
+    dest = VARIANTS_DIR / rel
+    if not dest.is_file():
+        if not (UPLOADS_DIR / source_rel).is_file():
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(_executor(), build_variants, source_rel, [width], [fmt])
+        except Exception as exc:
+            _failed(source_rel, exc)
+            return UPLOADS_DIR / source_rel
+    return dest
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Image derivative maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("backfill", help="build variants for every image under uploads/")
+    cmd.add_argument("--force", action="store_true", help="rebuild variants that already exist")
+    args = parser.parse_args()
+
+    if not ENABLED:
+        raise SystemExit("Image variants are disabled (Pillow missing or IMAGE_VARIANTS=0)")
+    sources = [
+        rel for rel in (p.relative_to(UPLOADS_DIR).as_posix() for p in sorted(UPLOADS_DIR.glob("*/*")) if p.is_file())
+        if _source_rel(f"/uploads/{rel}")
+    ]
+    built = 0
+    for done in _executor().map(build_variants, sources, [None] * len(sources), [None] * len(sources),
+                                [args.force] * len(sources)):
+        built += len(done)
+    print(f"{len(sources)} images, {built} variants written")
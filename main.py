@@ -1,36 +1,71 @@
 # main.py
-from pathlib import Path
-from datetime import datetime
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from fastapi.templating import Jinja2Templates
 
-from database import init_db
+import admission
+import cache
+import images
+import metrics
+from database import async_engine, init_db
+from route.bulk import router as bulk_router
 from route.categories import router as categories_router
 from route.blog import router as posts_router
 from route.banner import router as banner_router  # 👈 Banner API
+from route.feed import router as feed_router
+from route.media import router as media_router
+from route.pages import router as pages_router
+from route.resumable import router as resumable_router
+from static_files import UploadFiles
+from storage import UPLOADS_DIR, UploadLimitMiddleware, save_upload
+from views import buffer as view_buffer
+
+
+# ---------- Startup / shutdown ----------
+# Nothing touches the database or the filesystem at import time: each worker
+# does it here, once, before it takes traffic.
+def prepare() -> None:
+    init_db()  # pending schema migrations; one version lookup when up to date
+    cache.open_shared()  # cross-worker invalidation file, next to the database
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)  # bucket dirs are made on first upload
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    admission.configure_threadpool()  # sized to the DB pool (admission.py)
+    await run_in_threadpool(prepare)
+    view_buffer.start()  # buffered view counts
+    try:
+        yield
+    finally:
+        await view_buffer.stop()  # flush pending views
+        images.shutdown()
+        await async_engine.dispose()  # closes aiosqlite's connection threads
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadLimitMiddleware)  # 413 for oversized multipart bodies before they are spooled
+app.add_middleware(admission.AdmissionMiddleware)  # read/write concurrency limits, 503 when overloaded
+app.add_middleware(metrics.MetricsMiddleware)  # per-route latency / SQL stats, Server-Timing (sees 503s too)
 
-app = FastAPI()
-
-# ---------- Init DB ----------
-init_db()
 
 # ---------- Routers ----------
+app.include_router(bulk_router)  # /api/*/export|import (must precede the /{id} routes)
 app.include_router(categories_router)
 app.include_router(posts_router)
 app.include_router(banner_router)
+app.include_router(feed_router)  # /api/feed: banner + categories + latest posts in one request
+app.include_router(pages_router)  # public SSR pages under /blog
+app.include_router(resumable_router)  # /api/uploads: resumable chunked uploads
+app.include_router(media_router)  # /uploads/_variants/* (must precede the /uploads mount)
 
 # ---------- Uploads (static) ----------
-# Ensure folders exist
-Path("uploads/categories").mkdir(parents=True, exist_ok=True)
-Path("uploads/posts").mkdir(parents=True, exist_ok=True)
-Path("uploads/banner").mkdir(parents=True, exist_ok=True)
-Path("uploads/profile").mkdir(parents=True, exist_ok=True)
-Path("uploads/misc").mkdir(parents=True, exist_ok=True)
-
-# Serve /uploads/*
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Serve /uploads/* (long-lived caching, strong ETags, precompressed siblings);
+# the directory is created by the lifespan startup
+app.mount("/uploads", UploadFiles(directory=UPLOADS_DIR, check_dir=False), name="uploads")
 
 # ---------- Templates ----------
 templates = Jinja2Templates(directory="templates")
@@ -47,42 +82,36 @@ async def upload_file(
     Accepts a single file and saves it under /uploads/{bucket}/.
     Buckets: banner | categories | posts | profile | misc (default)
     Returns a public URL served by StaticFiles.
+
+    The file is streamed to disk in chunks (see storage.py); oversized or
+    disallowed files are rejected with 413/415.
     """
-    # Map friendly types to subdirectories
-    bucket_map = {
-        "banner": "banner",
-        "banners": "banner",
-        "category": "categories",
-        "categories": "categories",
-        "post": "posts",
-        "posts": "posts",
-        "profile": "profile",
-        "avatar": "profile",
-        "misc": "misc",
-    }
-    bucket = bucket_map.get(type.lower().strip(), "misc")
-
-    # Sanitize filename
-    orig = file.filename or "file"
-    safe = "".join(ch if ch.isalnum() or ch in (".", "_", "-", " ") else "_" for ch in orig).strip()
-    safe = safe.replace(" ", "_")
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    name = f"{ts}_{safe}" if safe else f"{ts}_file"
-
-    # Compute destination path
-    dest_dir = Path("uploads") / bucket
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    dest = dest_dir / name
-
-    # Save
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Empty file")
-    dest.write_bytes(data)
-
-    # Public URL
-    url = f"/uploads/{bucket}/{name}"
-    return {"url": url, "bucket": bucket, "filename": name}
+    stored = await save_upload(file, type)
+    return {"url": stored.url, "bucket": stored.bucket, "filename": stored.filename}
+
+
+# ---------- Read cache ----------
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Hit/miss counters and sizes of the in-process read caches (see cache.py)."""
+    return cache.stats()
+
+
+# ---------- Admission control ----------
+@app.get("/api/admission/stats")
+async def admission_stats():
+    """Limits, in-flight requests, queue depth and shed counts per gate (see admission.py).
+
+    `async` so it runs on the event loop, where the threadpool limiter lives.
+    """
+    return admission.stats()
+
+
+# ---------- Metrics ----------
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus text format: per-route latency, SQL count and DB time histograms (see metrics.py)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # ---------- Admin UI ----------
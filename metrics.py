@@ -0,0 +1,286 @@
+"""Per-request performance instrumentation and a Prometheus `/metrics` endpoint.
+
+`MetricsMiddleware` opens a `RequestStats` for every HTTP request, and
+SQLAlchemy cursor events on the database engines add each statement's count
+and time to it. When the request ends this records:
+
+- latency, SQL statements and DB time per route template (`/api/posts/{post_id}`),
+  as Prometheus histograms served by `render()` at GET /metrics
+- a `Server-Timing` header (`app`, `db` and `db-max` entries) that browser
+  devtools show under Timing. It is sent with the response headers, so for
+  streamed responses it covers the work done before the first byte only; the
+  histograms cover the whole request.
+
+Alerts are logged as warnings on the `metrics` logger and counted:
+
+- a statement slower than METRICS_SLOW_QUERY_MS
+- N+1 patterns: the same SQL run METRICS_N_PLUS_ONE or more times in one
+  request (typically a query inside a loop over rows)
+
+Metrics are per process; with several workers, scrape each one, or add up
+what each reports.
+
+Environment:
+- METRICS_SLOW_QUERY_MS  -> slow statement threshold in ms (default 100)
+- METRICS_N_PLUS_ONE     -> repeats of one statement per request that alert (default 10)
+- METRICS_SERVER_TIMING  -> "0" to stop sending the Server-Timing header
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from database import async_engine, engine, read_engine
+
+log = logging.getLogger("metrics")
+
+SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS") or 100)
+N_PLUS_ONE = int(os.getenv("METRICS_N_PLUS_ONE") or 10)
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "1").strip().lower() not in ("0", "false", "no", "off")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# ----------------------------------------
+# Prometheus primitives
+# ----------------------------------------
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _le(bound) -> str:
+    return f'le="{bound:g}"' if isinstance(bound, (int, float)) else f'le="{bound}"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class CounterMetric:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name, self.help, self.buckets = name, help, buckets
+        self._series: Dict[Labels, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, s in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets, s):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(labels, _le(bound))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(labels, _le('+Inf'))} {s[-1]}"
+            yield f"{self.name}_sum{_labels(labels)} {s[-2]:.6f}"
+            yield f"{self.name}_count{_labels(labels)} {s[-1]}"
+
+
+class GaugeMetric:
+    """A gauge read at scrape time: `collect()` yields (labels, value) pairs."""
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name, self.help, self.collect = name, help, collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in sorted(self.collect()):
+            yield f"{self.name}{_labels(labels)} {value:g}"
+
+
+requests_total = CounterMetric("http_requests_total", "HTTP requests by route template and status code")
+request_seconds = Histogram("http_request_duration_seconds", "Request latency by route template", LATENCY_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "SQL statements per request", QUERY_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per request", LATENCY_BUCKETS)
+slow_queries = CounterMetric("db_slow_queries_total", "Statements slower than METRICS_SLOW_QUERY_MS")
+n_plus_one = CounterMetric("db_n_plus_one_total", "Requests that ran one statement METRICS_N_PLUS_ONE+ times")
+statements_total = CounterMetric("db_statements_total", "SQL statements, inside requests or not")
+
+METRICS: List = [requests_total, request_seconds, request_queries, request_db_seconds, slow_queries, n_plus_one,
+                 statements_total]
+
+
+def register(*metrics) -> None:
+    """Add other modules' metrics (e.g. admission.py) to the /metrics output."""
+    METRICS.extend(metrics)
+
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+# ----------------------------------------
+# Per-request stats + SQL hooks
+# ----------------------------------------
+@dataclass
+class RequestStats:
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_seconds: float = 0.0
+    slowest: float = 0.0
+    slowest_sql: Optional[str] = None
+    by_statement: Counter = field(default_factory=Counter)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    """Stats of the request being handled (None outside requests)."""
+    return _current.get()
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    statements_total.inc()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.by_statement[statement] += 1
+        if elapsed > stats.slowest:
+            stats.slowest, stats.slowest_sql = elapsed, statement
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc()
+        log.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+
+def _error(context):
+    # a failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument(target) -> None:
+    event.listen(target, "before_cursor_execute", _before)
+    event.listen(target, "after_cursor_execute", _after)
+    event.listen(target, "handle_error", _error)
+
+
+for _engine in {engine, read_engine, async_engine.sync_engine}:
+    instrument(_engine)
+
+
+# ----------------------------------------
+# Middleware
+# ----------------------------------------
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "other"  # unmatched paths and mounts (/uploads)
+
+
+def _server_timing(stats: RequestStats) -> bytes:
+    app_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.db_seconds * 1000
+    return (
+        f'app;dur={app_ms:.1f}, db;dur={db_ms:.1f};desc="{stats.queries} queries", '
+        f"db-max;dur={stats.slowest * 1000:.1f}"
+    ).encode()
+
+
+class MetricsMiddleware:
+    """Pure ASGI (not BaseHTTPMiddleware) so streaming responses stay streaming."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    message.setdefault("headers", [])
+                    message["headers"] = [*message["headers"], (b"server-timing", _server_timing(stats))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._record(scope, stats, status)
+
+    @staticmethod
+    def _record(scope, stats: RequestStats, status: int) -> None:
+        elapsed = time.perf_counter() - stats.started
+        route = _escape(_route(scope))
+        labels: Labels = (("method", scope["method"]), ("route", route))
+        requests_total.inc(labels + (("status", str(status)),))
+        request_seconds.observe(labels, elapsed)
+        request_queries.observe(labels, stats.queries)
+        request_db_seconds.observe(labels, stats.db_seconds)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "%s %s %s %.1fms, %d queries in %.1fms, slowest %.1fms: %s",
+                scope["method"], route, status, elapsed * 1000, stats.queries, stats.db_seconds * 1000,
+                stats.slowest * 1000, " ".join((stats.slowest_sql or "-").split())[:200],
+            )
+        if stats.by_statement:
+            statement, repeats = stats.by_statement.most_common(1)[0]
+            if repeats >= N_PLUS_ONE:
+                n_plus_one.inc(labels)
+                log.warning(
+                    "possible N+1 on %s %s: statement ran %d times: %s",
+                    scope["method"], route, repeats, " ".join(statement.split())[:500],
+                )
@@ -0,0 +1,189 @@
+"""Versioned schema migrations.
+
+Every applied migration is recorded in the `schema_version` table. `migrate()`
+runs from `database.init_db()` in the app's lifespan startup. When the
+database is already at LATEST, that costs one indexed query: no reflection
+and no DDL. Otherwise it takes an exclusive lock next to the database file,
+so workers starting together don't migrate concurrently, re-checks the
+version and applies what's pending, each migration in its own transaction.
+
+Adding a schema change: append `(version, name, function)` to MIGRATIONS and
+never edit or reorder ones that have shipped. A function gets a Connection
+inside a transaction. SQLite's driver commits DDL as it runs, though, so a
+migration that fails halfway is re-run from the start next time: write them
+to be re-runnable (IF NOT EXISTS, check before adding a column).
+
+Version 1 creates the tables from the current models. On a new database the
+later migrations then find their work already done.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # current and latest version
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import SQLModel
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------------------
+# Helpers
+# ----------------------------------------
+def add_columns(conn: Connection, table: str, columns: Dict[str, str]) -> None:
+    """ALTER TABLE ADD COLUMN for each `name: DDL` the table doesn't have yet."""
+    present = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in present:
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {ddl}')
+
+
+# ----------------------------------------
+# Migrations
+# ----------------------------------------
+def _create_tables(conn: Connection) -> None:
+    from route import model  # noqa: F401  (registers the tables on SQLModel.metadata)
+
+    SQLModel.metadata.create_all(conn)
+
+
+def _post_content_columns(conn: Connection) -> None:
+    # content.py's write-time pipeline; fill old rows with `python content.py backfill`
+    add_columns(conn, "posts", {
+        "excerpt_auto": "BOOLEAN NOT NULL DEFAULT 0",
+        "content_html": "VARCHAR",
+        "toc": "JSON",
+    })
+
+
+def _full_text_search(conn: Connection) -> None:
+    from search import install_fts
+
+    install_fts(conn)
+
+
+def _category_counters(conn: Connection) -> None:
+    from counters import recount
+
+    add_columns(conn, "categories", {
+        "post_count": "INTEGER NOT NULL DEFAULT 0",
+        "active_post_count": "INTEGER NOT NULL DEFAULT 0",
+    })
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_posts_category_status_created ON posts (category_id, status, created_at)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_posts_status_created ON posts (status, created_at)")
+    recount(conn)
+
+
+def _resanitize_content(conn: Connection) -> None:
+    # stricter URL filtering (content.py)
+    from content import reprocess
+
+    reprocess(conn, force=True)
+
+
+def _plain_excerpts(conn: Connection) -> None:
+    # version 5 stored generated excerpts HTML-escaped; regenerate those that
+    # could differ (they contain "&") as plain text, like authored ones
+    from content import process
+
+    rows = conn.exec_driver_sql(
+        "SELECT id, content FROM posts WHERE excerpt_auto AND excerpt LIKE '%&%'"
+    ).all()
+    if rows:
+        now = datetime.utcnow()
+        conn.execute(
+            text("UPDATE posts SET excerpt = :excerpt, updated_at = :now WHERE id = :id"),
+            [{"id": id, "excerpt": process(content).excerpt or None, "now": now} for id, content in rows],
+        )
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create tables", _create_tables),
+    (2, "post content_html, toc, excerpt_auto", _post_content_columns),
+    (3, "FTS5 search indexes", _full_text_search),
+    (4, "category post counters, posts (category_id, status, created_at) indexes", _category_counters),
+    (5, "re-render post content with the stricter sanitizer", _resanitize_content),
+    (6, "generated post excerpts as plain text", _plain_excerpts),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+# ----------------------------------------
+# Runner
+# ----------------------------------------
+def current_version(engine: Engine) -> int:
+    with engine.connect() as conn:
+        try:
+            return conn.exec_driver_sql("SELECT max(version) FROM schema_version").scalar() or 0
+        except DBAPIError:  # no schema_version table yet
+            return 0
+
+
+@contextmanager
+def _exclusive(engine: Engine) -> Iterator[None]:
+    database = engine.url.database if engine.dialect.name == "sqlite" else None
+    if not database or database == ":memory:":
+        yield
+        return
+    with open(f"{database}.migrate-lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def migrate(engine: Engine) -> int:
+    """Apply pending migrations; returns how many ran."""
+    if current_version(engine) >= LATEST:
+        return 0
+    with _exclusive(engine):
+        version = current_version(engine)  # another worker may have just migrated
+        if version == 0:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "CREATE TABLE IF NOT EXISTS schema_version "
+                    "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+                )
+        applied = 0
+        for number, name, apply in MIGRATIONS:
+            if number <= version:
+                continue
+            t0 = time.perf_counter()
+            with engine.begin() as conn:
+                apply(conn)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": number, "n": name, "t": datetime.utcnow()},
+                )
+            log.info("applied migration %d (%s) in %.0f ms", number, name, (time.perf_counter() - t0) * 1000)
+            applied += 1
+        return applied
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--status", action="store_true", help="print the current and latest version only")
+    args = parser.parse_args()
+
+    if args.status:
+        print(f"schema version {current_version(engine)} (latest {LATEST})")
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        count = migrate(engine)
+        print(f"{count} migration(s) applied; schema version {current_version(engine)}")
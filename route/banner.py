@@ -2,23 +2,38 @@
 from __future__ import annotations
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Response
 from sqlmodel import Session, select
 
-from database import get_session
+import conditional
+from cache import banner_cache
+from database import get_read_session, get_session
 from route.model import Banner
 from schema import BannerRead, BannerUpdate
 
 router = APIRouter(prefix="/api/banner", tags=["banner"])
 
+# Plain `def` routes on purpose: FastAPI runs them in its threadpool, so the
+# sync session never blocks the event loop.
+
 
 def _get_singleton(session: Session) -> Banner | None:
     return session.exec(select(Banner).limit(1)).first()
 
 
 @router.get("", response_model=BannerRead)
-def get_banner(session: Session = Depends(get_session)):
-    b = _get_singleton(session)
+def get_banner(request: Request, response: Response, session: Session = Depends(get_read_session)):
+    def validators():
+        v = conditional.collection_validators(session, Banner, key="get")
+        return v if v.count else None  # nothing to validate: 404
+
+    def load():
+        b = _get_singleton(session)
+        return BannerRead.model_validate(b) if b else None
+
+    not_modified, _, b = conditional.cached(request, response, banner_cache, ("get",), validators, load)
+    if not_modified is not None:
+        return not_modified
     if not b:
         # Frontend handles 404 as "not configured yet"
         raise HTTPException(status_code=404, detail="Banner not configured")
@@ -26,9 +41,16 @@ def get_banner(session: Session = Depends(get_session)):
 
 
 @router.get("/all", response_model=list[BannerRead])
-def get_banner_list(session: Session = Depends(get_session)):
+def get_banner_list(request: Request, response: Response, session: Session = Depends(get_read_session)):
     """Handy for your 'List' table. Returns [] or [banner]."""
-    return session.exec(select(Banner)).all()
+    not_modified, _, rows = conditional.cached(
+        request, response, banner_cache, ("all",),
+        lambda: conditional.collection_validators(session, Banner, key="all"),
+        lambda: [BannerRead.model_validate(b) for b in session.exec(select(Banner)).all()],
+    )
+    if not_modified is not None:
+        return not_modified
+    return rows
 
 
 @router.put("", response_model=BannerRead)
@@ -73,6 +95,7 @@ def upsert_banner(
     session.add(b)
     session.commit()
     session.refresh(b)
+    banner_cache.clear()
     return b
 
 
@@ -84,4 +107,5 @@ def delete_banner(session: Session = Depends(get_session)):
         return {"ok": True}
     session.delete(b)
     session.commit()
+    banner_cache.clear()
     return {"ok": True}
@@ -1,21 +1,28 @@
 from __future__ import annotations
 
 from datetime import datetime
-from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Union
 import re
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, Response
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+import conditional
+import counters
+from cache import posts_cache
+from content import apply as apply_content
+from database import get_async_session, get_read_session
+from fastjson import FastJSONResponse, dumps, rows_to_dicts
+from images import srcset
+from route.categories import invalidate_category
 from route.model import Category, Post
-from schema import PostRead
-
-# uploads/posts/
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_DIR = BASE_DIR / "uploads" / "posts"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+from route.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_filter, keyset_order, next_cursor
+from schema import PostPage, PostRead, PostSearchHit, PostSummary
+from search import matching_ids, search_posts
+from storage import save_upload
+from views import buffer as view_buffer, visitor_key
 
 
 def slugify(text: str) -> str:
@@ -26,43 +33,175 @@ def slugify(text: str) -> str:
 
 
 async def save_cover(file: UploadFile | None) -> Optional[str]:
-    if not file:
+    if not file or not file.filename:
         return None
-    safe = file.filename.replace(" ", "_")
-    name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{safe}"
-    dest = UPLOADS_DIR / name
-    data = await file.read()
-    dest.write_bytes(data)
-    return f"/uploads/posts/{name}"
+    stored = await save_upload(file, "posts")
+    return stored.url
+
+
+# Read endpoints select these columns and encode the rows directly (fastjson.py)
+POST_COLUMNS = list(PostRead.model_fields)
+POST_COMPUTED = {"cover_srcset": ("cover_url", srcset)}
+
+
+def list_columns(view: Optional[str], fields: Optional[str]) -> Optional[List[str]]:
+    """Column names to project for a listing, or None for full posts (POST_COLUMNS)."""
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [n for n in names if n not in PostRead.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        return ["id"] + [n for n in dict.fromkeys(names) if n != "id"]
+    if view == "summary":
+        return list(PostSummary.model_fields)
+    return None
+
+
+def post_filters(q: Optional[str], category_id: Optional[int], status: Optional[str]) -> list:
+    where = []
+    if q:
+        ids = matching_ids("posts_fts", q)
+        where.append(Post.id.in_(ids) if ids is not None else Post.title.ilike(f"%{q}%"))
+    if category_id is not None:
+        where.append(Post.category_id == category_id)
+    if status is not None:
+        where.append(Post.status == status)
+    return where
 
 
 router = APIRouter(prefix="/api/posts", tags=["posts"])
 
 
-@router.get("", response_model=List[PostRead])
+@router.get("", response_model=Union[List[PostRead], PostPage])
 def list_posts(
+    request: Request,
+    response: Response,
     q: Optional[str] = None,
     category_id: Optional[int] = None,
     status: Optional[str] = None,
-    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    view: Optional[str] = Query(None, pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
+    session: Session = Depends(get_read_session),
 ):
-    stmt = select(Post)
-    if q:
-        stmt = stmt.where(Post.title.ilike(f"%{q}%"))
-    if category_id is not None:
-        stmt = stmt.where(Post.category_id == category_id)
-    if status is not None:
-        stmt = stmt.where(Post.status == status)
-    stmt = stmt.order_by(Post.created_at.desc())
-    return session.exec(stmt).all()
+    """
+    Without `limit`/`cursor` this returns every matching post (legacy behaviour).
+    With either, it returns one page: {"items": [...], "next_cursor": "..."};
+    pass `next_cursor` back as `cursor` to fetch the following page.
+
+    `view=summary` (or an explicit `fields=title,slug,...`) selects only those
+    columns in SQL, so post bodies are neither read from disk nor serialized.
+    """
+    names = list_columns(view, fields)
+    key = ("list", q, category_id, status, limit, cursor, names and tuple(names))
+    where = post_filters(q, category_id, status)
+    not_modified, v, payload = conditional.cached(
+        request, response, posts_cache, key,
+        lambda: conditional.collection_validators(session, Post, *where, key=key),
+        lambda: dumps(query_posts(session, names or POST_COLUMNS, where, limit, cursor)),
+    )
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse(payload, headers=v.headers())
+
+
+def query_posts(session, names, where, limit, cursor):
+    """Run a listing query; returns the JSON data (a list, or a page dict)."""
+    # created_at is always read so the page cursor can be built from it
+    cols = names if "created_at" in names else names + ["created_at"]
+    stmt = select(*(getattr(Post, n) for n in cols))
+    if where:
+        stmt = stmt.where(*where)
+    stmt = stmt.order_by(*keyset_order(Post))
+
+    if limit is None and cursor is None:
+        return rows_to_dicts(session.exec(stmt).all(), names, POST_COMPUTED)
+
+    limit = limit or DEFAULT_LIMIT
+    after = keyset_filter(Post, cursor)
+    if after is not None:
+        stmt = stmt.where(after)
+    rows = session.exec(stmt.limit(limit + 1)).all()
+    return {"items": rows_to_dicts(rows[:limit], names, POST_COMPUTED), "next_cursor": next_cursor(rows, limit)}
+
+
+@router.get("/search", response_model=List[PostSearchHit])
+def search(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    category_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    """Relevance-ranked full-text search over title, excerpt and content."""
+    key = ("search", q, category_id, status, limit)
+    # validated against every post the filters allow: any edit among them
+    # may change the hits or their ranking
+    not_modified, _, hits = conditional.cached(
+        request, response, posts_cache, key,
+        lambda: conditional.collection_validators(session, Post, *post_filters(None, category_id, status), key=key),
+        lambda: [
+            PostSearchHit.model_validate(dict(r))
+            for r in search_posts(session, q, limit=limit, status=status, category_id=category_id)
+        ],
+    )
+    if not_modified is not None:
+        return not_modified
+    return hits
 
 
 @router.get("/{post_id}", response_model=PostRead)
-def get_post(post_id: int, session: Session = Depends(get_session)):
-    post = session.get(Post, post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    return post
+def get_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+):
+    def load() -> bytes:
+        row = session.exec(select(*(getattr(Post, n) for n in POST_COLUMNS)).where(Post.id == post_id)).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return dumps(rows_to_dicts([row], POST_COLUMNS, POST_COMPUTED)[0])
+
+    not_modified, v, body = conditional.cached(
+        request, response, posts_cache, ("get", post_id),
+        lambda: conditional.item_validators(session, Post, post_id), load,
+    )
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse(body, headers=v.headers() if v else None)
+
+
+@router.post("/{post_id}/view", status_code=202)
+async def record_view(post_id: int, request: Request):
+    """Count a page view. Buffered in memory and flushed in batches (see views.py)."""
+    host = request.client.host if request.client else None
+    counted = view_buffer.record(post_id, visitor_key(host, request.headers.get("user-agent")))
+    return {"counted": counted}
+
+
+def invalidate_post(post_id: Optional[int] = None) -> None:
+    """Drop cached reads a write to `post_id` (or a new post) can change."""
+    posts_cache.clear("list")
+    posts_cache.clear("search")
+    if post_id is not None:
+        posts_cache.discard(("get", post_id))
+
+
+async def update_counters(session: AsyncSession, old: counters.State, new: counters.State) -> List[int]:
+    """Apply a post write to its categories' counters (before commit); returns the categories changed."""
+    stmts = counters.updates(old, new)
+    for stmt in stmts:
+        await session.exec(stmt)
+    return list(counters.deltas(old, new))
+
+
+def invalidate_counts(category_ids: List[int]) -> None:
+    for cat_id in category_ids:
+        invalidate_category(cat_id)
 
 
 @router.post("", response_model=PostRead, status_code=201)
@@ -72,9 +211,8 @@ async def create_post(
     status: str = Form("active"),
     excerpt: Optional[str] = Form(None),
     content: Optional[str] = Form(None),
-    read_time: int = Form(5),
     thumbnail: Optional[UploadFile] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     if not title.strip():
         raise HTTPException(status_code=400, detail="Title is required")
@@ -85,11 +223,11 @@ async def create_post(
     if category_id is None:
         raise HTTPException(status_code=400, detail="Category must be selected")
 
-    if not session.get(Category, category_id):
+    if not await session.get(Category, category_id):
         raise HTTPException(status_code=400, detail="Invalid category_id")
 
     slug = slugify(title)
-    exists = session.exec(select(Post).where(Post.slug == slug)).first()
+    exists = (await session.exec(select(Post).where(Post.slug == slug))).first()
     if exists:
         raise HTTPException(status_code=400, detail="Post with similar slug already exists")
 
@@ -99,14 +237,17 @@ async def create_post(
         slug=slug,
         category_id=category_id,
         status=status,
-        excerpt=excerpt,
         content=content,
-        read_time=read_time,
         cover_url=cover_url,
     )
+    # read_time, content_html, toc and (if not given) excerpt come from the body
+    await run_in_threadpool(apply_content, post, True, excerpt or "")
     session.add(post)
-    session.commit()
-    session.refresh(post)
+    changed = await update_counters(session, None, (post.category_id, post.status))
+    await session.commit()
+    await session.refresh(post)
+    invalidate_post()
+    invalidate_counts(changed)
     return post
 
 
@@ -118,40 +259,40 @@ async def update_post(
     status: Optional[str] = Form(None),
     excerpt: Optional[str] = Form(None),
     content: Optional[str] = Form(None),
-    read_time: Optional[int] = Form(None),
     thumbnail: Optional[UploadFile] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    post = session.get(Post, post_id)
+    post = await session.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
+    before = (post.category_id, post.status)
 
     if title:
         if not title.strip():
             raise HTTPException(status_code=400, detail="Title cannot be empty")
         new_slug = slugify(title)
         if new_slug != post.slug:
-            clash = session.exec(select(Post).where(Post.slug == new_slug)).first()
+            clash = (await session.exec(select(Post).where(Post.slug == new_slug))).first()
             if clash:
                 raise HTTPException(status_code=400, detail="Another post already uses this slug")
         post.title = title
         post.slug = new_slug
 
     if category_id is not None:
-        if category_id != 0 and not session.get(Category, category_id):
+        if category_id != 0 and not await session.get(Category, category_id):
             raise HTTPException(status_code=400, detail="Invalid category_id")
         post.category_id = category_id
 
     if status is not None:
         post.status = status
-    if excerpt is not None:
-        post.excerpt = excerpt
     if content is not None:
         if not content.strip():
             raise HTTPException(status_code=400, detail="Content cannot be empty")
+    content_changed = content is not None and content != post.content
+    if content_changed:
         post.content = content
-    if read_time is not None:
-        post.read_time = int(read_time)
+    if content_changed or excerpt is not None:
+        await run_in_threadpool(apply_content, post, content_changed, excerpt)
 
     if thumbnail is not None:
         url = await save_cover(thumbnail)
@@ -160,16 +301,22 @@ async def update_post(
 
     post.updated_at = datetime.utcnow()
     session.add(post)
-    session.commit()
-    session.refresh(post)
+    changed = await update_counters(session, before, (post.category_id, post.status))
+    await session.commit()
+    await session.refresh(post)
+    invalidate_post(post_id)
+    invalidate_counts(changed)
     return post
 
 
 @router.delete("/{post_id}", status_code=204)
-async def delete_post(post_id: int, session: Session = Depends(get_session)):
-    post = session.get(Post, post_id)
+async def delete_post(post_id: int, session: AsyncSession = Depends(get_async_session)):
+    post = await session.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    session.delete(post)
-    session.commit()
+    changed = await update_counters(session, (post.category_id, post.status), None)
+    await session.delete(post)
+    await session.commit()
+    invalidate_post(post_id)
+    invalidate_counts(changed)
     return Response(status_code=204)  # ✅ No body for 204
@@ -0,0 +1,320 @@
+"""Bulk NDJSON export / import of posts and categories.
+
+    GET  /api/categories/export          one category per line
+    GET  /api/posts/export[?status=]     one post per line (+ category_slug)
+    POST /api/categories/import[?on_conflict=error|skip|update]
+    POST /api/posts/import[?on_conflict=error|skip|update]
+
+Exports stream from a server-side cursor, BATCH_SIZE rows at a time, so
+memory use doesn't grow with the table. An export file can be imported
+as-is into another environment: ids are ignored, and posts are linked to
+categories by `category_slug`.
+
+Imports read the request body as a stream and handle it in batches of
+BATCH_SIZE lines. Each batch is validated row by row. Slugs and categories
+are resolved with one `IN (...)` query each, and the batch is written with
+executemany in its own transaction. Bad rows are reported by line number
+(first MAX_REPORTED_ERRORS) and don't stop the import. The rows already
+committed stay committed.
+
+Post bodies go through the write-time content pipeline (content.py), so
+read_time, content_html and toc in the input are ignored.
+
+Rows whose slug already exists: `on_conflict=error` (default) reports them,
+`skip` ignores them, `update` overwrites them.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, select, update
+
+from cache import categories_cache, posts_cache
+from content import process as process_content
+from counters import recount
+from database import engine, read_engine
+from route.blog import slugify
+from route.model import Category, Post
+from schema import CategoryImport, ImportResult, ImportRowError, PostImport
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+router = APIRouter(tags=["bulk"])
+
+posts_table = Post.__table__
+categories_table = Category.__table__
+
+
+# ----------------------------------------
+# Export
+# ----------------------------------------
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _ndjson(stmt) -> Iterator[bytes]:
+    # sync generator: StreamingResponse iterates it on the threadpool
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(stmt)
+        for rows in result.mappings().partitions():
+            yield b"".join(
+                json.dumps(dict(row), default=_json_default, ensure_ascii=False).encode() + b"\n"
+                for row in rows
+            )
+
+
+def _ndjson_response(stmt, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        _ndjson(stmt),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/api/categories/export")
+def export_categories():
+    return _ndjson_response(select(categories_table).order_by(categories_table.c.id), "categories.ndjson")
+
+
+@router.get("/api/posts/export")
+def export_posts(status: Optional[str] = None):
+    stmt = (
+        select(posts_table, categories_table.c.slug.label("category_slug"))
+        .outerjoin(categories_table, categories_table.c.id == posts_table.c.category_id)
+        .order_by(posts_table.c.id)
+    )
+    if status is not None:
+        stmt = stmt.where(posts_table.c.status == status)
+    return _ndjson_response(stmt, "posts.ndjson")
+
+
+# ----------------------------------------
+# Import
+# ----------------------------------------
+Batch = List[Tuple[int, bytes]]  # (line number, raw JSON)
+
+
+async def _lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    buf = b""
+    lineno = 0
+    async for chunk in request.stream():
+        buf += chunk
+        if b"\n" not in chunk:
+            if len(buf) > MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line {lineno + 1} is too long")
+            continue
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            lineno += 1
+            if line.strip():
+                yield lineno, line
+    if buf.strip():
+        yield lineno + 1, buf
+
+
+async def _batches(request: Request) -> AsyncIterator[Batch]:
+    batch: Batch = []
+    async for item in _lines(request):
+        batch.append(item)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _fail(result: ImportResult, line: int, error: str) -> None:
+    result.failed += 1
+    if len(result.errors) < MAX_REPORTED_ERRORS:
+        result.errors.append(ImportRowError(line=line, error=error))
+
+
+def _parse(model, batch: Batch, result: ImportResult) -> list:
+    parsed = []
+    for line, raw in batch:
+        try:
+            parsed.append((line, model.model_validate_json(raw)))
+        except ValidationError as e:
+            err = e.errors()[0]
+            where = ".".join(str(p) for p in err["loc"])
+            _fail(result, line, f"{where}: {err['msg']}" if where else err["msg"])
+    return parsed
+
+
+def _write(conn, table, rows: List[dict], updates: List[dict]) -> None:
+    touched = set()
+    if table is posts_table:  # category counters: where posts are added, and where updated ones were
+        touched = {r["category_id"] for r in rows + updates}
+        if updates:
+            touched.update(conn.execute(
+                select(posts_table.c.category_id).where(posts_table.c.slug.in_([u["slug"] for u in updates]))
+            ).scalars())
+    if rows:
+        conn.execute(insert(table), rows)
+    if updates:
+        columns = [c for c in updates[0] if c != "slug"]
+        stmt = (
+            update(table)
+            .where(table.c.slug == bindparam("_slug"))
+            .values({c: bindparam(c) for c in columns})
+        )
+        conn.execute(stmt, [{**u, "_slug": u["slug"]} for u in updates])
+    if touched:
+        recount(conn, touched)
+
+
+def _commit(result: ImportResult, rows: list, updates: list, table, lines: List[int]) -> None:
+    try:
+        with engine.begin() as conn:
+            _write(conn, table, [r for _, r in rows], [u for _, u in updates])
+    except Exception as e:  # the whole batch rolled back
+        for line in lines:
+            _fail(result, line, f"batch rolled back: {e.__class__.__name__}: {e}")
+        return
+    result.inserted += len(rows)
+    result.updated += len(updates)
+
+
+def _place(result: ImportResult, line: int, row: dict, taken: set, seen: set,
+           on_conflict: str, rows: list, updates: list) -> None:
+    slug = row["slug"]
+    if slug in seen:
+        _fail(result, line, f"duplicate slug '{slug}' earlier in this batch")
+        return
+    seen.add(slug)
+    if slug not in taken:
+        rows.append((line, row))
+    elif on_conflict == "skip":
+        result.skipped += 1
+    elif on_conflict == "update":
+        row.pop("created_at")
+        updates.append((line, row))
+    else:
+        _fail(result, line, f"slug '{slug}' already exists")
+
+
+def import_categories_batch(batch: Batch, on_conflict: str, result: ImportResult) -> None:
+    parsed = _parse(CategoryImport, batch, result)
+    now = datetime.utcnow()
+    items = [(line, item, slugify(item.slug or item.name)) for line, item in parsed]
+    with read_engine.connect() as conn:
+        taken = set(conn.execute(
+            select(categories_table.c.slug).where(categories_table.c.slug.in_({s for _, _, s in items}))
+        ).scalars())
+
+    rows: list = []
+    updates: list = []
+    seen: set = set()
+    for line, item, slug in items:
+        if not item.name.strip():
+            _fail(result, line, "name: Category name is required")
+            continue
+        row = {
+            "name": item.name,
+            "slug": slug,
+            "description": item.description,
+            "thumbnail_url": item.thumbnail_url,
+            "created_at": item.created_at or now,
+            "updated_at": item.updated_at or now,
+        }
+        _place(result, line, row, taken, seen, on_conflict, rows, updates)
+    _commit(result, rows, updates, categories_table, [line for line, _ in rows + updates])
+
+
+def import_posts_batch(batch: Batch, on_conflict: str, result: ImportResult) -> None:
+    parsed = _parse(PostImport, batch, result)
+    now = datetime.utcnow()
+    items = [(line, item, slugify(item.slug or item.title)) for line, item in parsed]
+    with read_engine.connect() as conn:
+        taken = set(conn.execute(
+            select(posts_table.c.slug).where(posts_table.c.slug.in_({s for _, _, s in items}))
+        ).scalars())
+        by_slug: Dict[str, int] = dict(conn.execute(
+            select(categories_table.c.slug, categories_table.c.id)
+            .where(categories_table.c.slug.in_({i.category_slug for _, i, _ in items if i.category_slug}))
+        ).all())
+        known_ids = set(conn.execute(
+            select(categories_table.c.id)
+            .where(categories_table.c.id.in_({i.category_id for _, i, _ in items if i.category_id is not None}))
+        ).scalars())
+
+    rows: list = []
+    updates: list = []
+    seen: set = set()
+    for line, item, slug in items:
+        if not item.title.strip():
+            _fail(result, line, "title: Title is required")
+            continue
+        if item.category_slug:
+            category_id = by_slug.get(item.category_slug)
+            if category_id is None:
+                _fail(result, line, f"category_slug: unknown category '{item.category_slug}'")
+                continue
+        elif item.category_id is not None and item.category_id in known_ids:
+            category_id = item.category_id
+        else:
+            _fail(result, line, "category_id: Invalid category_id")
+            continue
+        done = process_content(item.content)
+        auto = item.excerpt_auto or not item.excerpt
+        row = {
+            "title": item.title,
+            "slug": slug,
+            "category_id": category_id,
+            "cover_url": item.cover_url,
+            "status": item.status,
+            "excerpt": (done.excerpt or None) if auto else item.excerpt,
+            "excerpt_auto": auto,
+            "content": item.content,
+            "content_html": done.content_html,
+            "toc": done.toc,
+            "read_time": done.read_time,
+            "views": item.views,
+            "created_at": item.created_at or now,
+            "updated_at": item.updated_at or now,
+        }
+        _place(result, line, row, taken, seen, on_conflict, rows, updates)
+    _commit(result, rows, updates, posts_table, [line for line, _ in rows + updates])
+
+
+@router.post("/api/categories/import", response_model=ImportResult)
+async def import_categories(
+    request: Request,
+    on_conflict: str = Query("error", pattern="^(error|skip|update)$"),
+):
+    """Body: NDJSON, one category per line (the format of /api/categories/export)."""
+    result = ImportResult()
+    try:
+        async for batch in _batches(request):
+            await run_in_threadpool(import_categories_batch, batch, on_conflict, result)
+    finally:
+        categories_cache.clear()
+    result.errors.sort(key=lambda e: e.line)
+    return result
+
+
+@router.post("/api/posts/import", response_model=ImportResult)
+async def import_posts(
+    request: Request,
+    on_conflict: str = Query("error", pattern="^(error|skip|update)$"),
+):
+    """Body: NDJSON, one post per line (the format of /api/posts/export)."""
+    result = ImportResult()
+    try:
+        async for batch in _batches(request):
+            await run_in_threadpool(import_posts_batch, batch, on_conflict, result)
+    finally:
+        posts_cache.clear()
+        categories_cache.clear()  # post counts
+    result.errors.sort(key=lambda e: e.line)
+    return result
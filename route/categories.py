@@ -1,21 +1,23 @@
 from __future__ import annotations
 
 from datetime import datetime
-from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Union
 import re
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, Response
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, Response
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
-from route.model import Category, Post
-from schema import CategoryRead
-
-# uploads/categories/
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_DIR = BASE_DIR / "uploads" / "categories"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+import conditional
+from cache import categories_cache
+from database import get_async_session, get_read_session
+from fastjson import FastJSONResponse, dumps, rows_to_dicts
+from images import srcset
+from route.model import Category
+from route.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_filter, keyset_order, next_cursor
+from schema import CategoryPage, CategoryRead
+from search import matching_ids
+from storage import save_upload
 
 
 def slugify(text: str) -> str:
@@ -26,34 +28,91 @@ def slugify(text: str) -> str:
 
 
 async def save_thumbnail(file: UploadFile | None) -> Optional[str]:
-    if not file:
+    if not file or not file.filename:
         return None
-    safe = file.filename.replace(" ", "_")
-    name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{safe}"
-    dest = UPLOADS_DIR / name
-    data = await file.read()
-    dest.write_bytes(data)
-    return f"/uploads/categories/{name}"
+    stored = await save_upload(file, "categories")
+    return stored.url
+
+
+# Read endpoints select these columns and encode the rows directly (fastjson.py)
+CATEGORY_COLUMNS = list(CategoryRead.model_fields)
+CATEGORY_COMPUTED = {"thumbnail_srcset": ("thumbnail_url", srcset)}
 
 
 router = APIRouter(prefix="/api/categories", tags=["categories"])
 
 
-@router.get("", response_model=List[CategoryRead])
-def list_categories(q: Optional[str] = None, session: Session = Depends(get_session)):
-    stmt = select(Category)
+@router.get("", response_model=Union[List[CategoryRead], CategoryPage])
+def list_categories(
+    request: Request,
+    response: Response,
+    q: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_read_session),
+):
+    """Unpaginated list by default; `limit`/`cursor` switch to keyset pages."""
+    key = ("list", q, limit, cursor)
+    where = []
     if q:
-        stmt = stmt.where(Category.name.ilike(f"%{q}%"))
-    stmt = stmt.order_by(Category.created_at.desc())
-    return session.exec(stmt).all()
+        ids = matching_ids("categories_fts", q)
+        where.append(Category.id.in_(ids) if ids is not None else Category.name.ilike(f"%{q}%"))
+    not_modified, v, payload = conditional.cached(
+        request, response, categories_cache, key,
+        lambda: conditional.collection_validators(session, Category, *where, key=key),
+        lambda: dumps(query_categories(session, where, limit, cursor)),
+    )
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse(payload, headers=v.headers())
+
+
+def query_categories(session, where, limit, cursor):
+    """Run a listing query; returns the JSON data (a list, or a page dict)."""
+    stmt = select(*(getattr(Category, n) for n in CATEGORY_COLUMNS))
+    if where:
+        stmt = stmt.where(*where)
+    stmt = stmt.order_by(*keyset_order(Category))
+
+    if limit is None and cursor is None:
+        return rows_to_dicts(session.exec(stmt).all(), CATEGORY_COLUMNS, CATEGORY_COMPUTED)
+
+    limit = limit or DEFAULT_LIMIT
+    after = keyset_filter(Category, cursor)
+    if after is not None:
+        stmt = stmt.where(after)
+    rows = session.exec(stmt.limit(limit + 1)).all()
+    items = rows_to_dicts(rows[:limit], CATEGORY_COLUMNS, CATEGORY_COMPUTED)
+    return {"items": items, "next_cursor": next_cursor(rows, limit)}
 
 
 @router.get("/{cat_id}", response_model=CategoryRead)
-def get_category(cat_id: int, session: Session = Depends(get_session)):
-    cat = session.get(Category, cat_id)
-    if not cat:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return cat
+def get_category(
+    cat_id: int,
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+):
+    def load() -> bytes:
+        stmt = select(*(getattr(Category, n) for n in CATEGORY_COLUMNS)).where(Category.id == cat_id)
+        row = session.exec(stmt).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Category not found")
+        return dumps(rows_to_dicts([row], CATEGORY_COLUMNS, CATEGORY_COMPUTED)[0])
+
+    not_modified, v, body = conditional.cached(
+        request, response, categories_cache, ("get", cat_id),
+        lambda: conditional.item_validators(session, Category, cat_id), load,
+    )
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse(body, headers=v.headers() if v else None)
+
+
+def invalidate_category(cat_id: Optional[int] = None) -> None:
+    categories_cache.clear("list")
+    if cat_id is not None:
+        categories_cache.discard(("get", cat_id))
 
 
 @router.post("", response_model=CategoryRead, status_code=201)
@@ -61,21 +120,22 @@ async def create_category(
     name: str = Form(...),
     description: Optional[str] = Form(None),
     thumbnail: Optional[UploadFile] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     if not name.strip():
         raise HTTPException(status_code=400, detail="Category name is required")
 
     slug = slugify(name)
-    exists = session.exec(select(Category).where(Category.slug == slug)).first()
+    exists = (await session.exec(select(Category).where(Category.slug == slug))).first()
     if exists:
         raise HTTPException(status_code=400, detail="Category with similar slug already exists")
 
     thumb_url = await save_thumbnail(thumbnail) if thumbnail else None
     cat = Category(name=name, slug=slug, description=description, thumbnail_url=thumb_url)
     session.add(cat)
-    session.commit()
-    session.refresh(cat)
+    await session.commit()
+    await session.refresh(cat)
+    invalidate_category()
     return cat
 
 
@@ -85,9 +145,9 @@ async def update_category(
     name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     thumbnail: Optional[UploadFile] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    cat = session.get(Category, cat_id)
+    cat = await session.get(Category, cat_id)
     if not cat:
         raise HTTPException(status_code=404, detail="Category not found")
 
@@ -96,7 +156,7 @@ async def update_category(
             raise HTTPException(status_code=400, detail="Category name cannot be empty")
         new_slug = slugify(name)
         if new_slug != cat.slug:
-            clash = session.exec(select(Category).where(Category.slug == new_slug)).first()
+            clash = (await session.exec(select(Category).where(Category.slug == new_slug))).first()
             if clash:
                 raise HTTPException(status_code=400, detail="Another category already uses this slug")
         cat.name = name
@@ -112,21 +172,22 @@ async def update_category(
 
     cat.updated_at = datetime.utcnow()
     session.add(cat)
-    session.commit()
-    session.refresh(cat)
+    await session.commit()
+    await session.refresh(cat)
+    invalidate_category(cat_id)
     return cat
 
 
 @router.delete("/{cat_id}", status_code=204)
-async def delete_category(cat_id: int, session: Session = Depends(get_session)):
-    cat = session.get(Category, cat_id)
+async def delete_category(cat_id: int, session: AsyncSession = Depends(get_async_session)):
+    cat = await session.get(Category, cat_id)
     if not cat:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    linked = session.exec(select(Post).where(Post.category_id == cat_id)).first()
-    if linked:
+    if cat.post_count:  # maintained by the post routes (counters.py)
         raise HTTPException(status_code=400, detail="Cannot delete category with existing posts")
 
-    session.delete(cat)
-    session.commit()
+    await session.delete(cat)
+    await session.commit()
+    invalidate_category(cat_id)
     return Response(status_code=204)
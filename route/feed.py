@@ -0,0 +1,86 @@
+"""GET /api/feed: banner, categories and the latest posts in one response.
+
+The home page used to make three requests (/api/banner, /api/categories,
+/api/posts). Over a slow mobile connection those round trips cost more than
+the queries behind them. This endpoint returns all three, from one session,
+with a fixed number of statements however many rows there are:
+
+    1. validators: count / max(updated_at) / max(id) of banners, categories
+       and posts, all in one statement, giving one ETag for the whole payload
+    2. the banner
+    3. categories, with their post counts (materialized, see counters.py)
+    4. the newest `limit` active posts, summary columns only
+
+A matching If-None-Match stops after statement 1 with a 304. The encoded
+body is cached together with its validators, under a key made of the
+versions of the banner, categories and posts caches (cache.py): every write
+route invalidates one of those, which moves the key. While nothing changes,
+a request, 304 or not, runs no statement at all.
+`benchmarks/feed_queries.py` checks these counts.
+"""
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlmodel import Session, select
+
+import conditional
+from cache import banner_cache, categories_cache, feed_cache, posts_cache
+from database import get_read_session
+from fastjson import FastJSONResponse, dumps, rows_to_dicts
+from images import srcset
+from route.model import Banner, Category, Post
+from route.pagination import MAX_LIMIT, keyset_order
+from schema import BannerRead, CategoryRead, HomeFeed, PostSummary
+
+DEFAULT_FEED_LIMIT = 10
+
+BANNER_COLUMNS = list(BannerRead.model_fields)
+BANNER_COMPUTED = {"image1_srcset": ("image1_url", srcset), "image2_srcset": ("image2_url", srcset)}
+CATEGORY_COLUMNS = list(CategoryRead.model_fields)
+CATEGORY_COMPUTED = {"thumbnail_srcset": ("thumbnail_url", srcset)}
+POST_COLUMNS = list(PostSummary.model_fields)
+POST_COMPUTED = {"cover_srcset": ("cover_url", srcset)}
+
+router = APIRouter(prefix="/api/feed", tags=["feed"])
+
+
+def load_feed(session: Session, limit: int) -> dict:
+    banner = session.exec(select(*(getattr(Banner, n) for n in BANNER_COLUMNS)).limit(1)).first()
+
+    categories = session.exec(
+        select(*(getattr(Category, n) for n in CATEGORY_COLUMNS)).order_by(*keyset_order(Category))
+    ).all()
+
+    posts = session.exec(
+        select(*(getattr(Post, n) for n in POST_COLUMNS))
+        .where(Post.status == "active")
+        .order_by(*keyset_order(Post))
+        .limit(limit)
+    ).all()
+
+    return {
+        "banner": rows_to_dicts([banner], BANNER_COLUMNS, BANNER_COMPUTED)[0] if banner else None,
+        "categories": rows_to_dicts(categories, CATEGORY_COLUMNS, CATEGORY_COMPUTED),
+        "posts": rows_to_dicts(posts, POST_COLUMNS, POST_COMPUTED),
+    }
+
+
+@router.get("", response_model=HomeFeed)
+def home_feed(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_FEED_LIMIT, ge=1, le=MAX_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    """Banner (null if not configured), categories with active post counts, newest active posts."""
+    versions = (banner_cache.version(), categories_cache.version(), posts_cache.version())
+    not_modified, v, body = conditional.cached(
+        request, response, feed_cache, (limit, versions),
+        lambda: conditional.combined_validators(
+            session, (Banner, []), (Category, []), (Post, []), key=("feed", limit),
+        ),
+        lambda: dumps(load_feed(session, limit)),
+    )
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse(body, headers=v.headers())
@@ -0,0 +1,30 @@
+# route/media.py
+from __future__ import annotations
+
+from mimetypes import guess_type
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+import images
+
+router = APIRouter(prefix="/uploads/_variants", tags=["media"])
+
+
+@router.get("/{bucket}/{name}")
+async def get_variant(bucket: str, name: str):
+    """Serve a resized/re-encoded image, building it on first request."""
+    rel = f"{bucket}/{name}"
+    path = await images.ensure_variant(rel)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    if path != images.VARIANTS_DIR / rel:
+        # building it failed: the original for now, and ask again next time
+        return FileResponse(path, media_type=guess_type(path.name)[0], headers={"Cache-Control": "no-store"})
+    fmt = path.suffix.lstrip(".")
+    return FileResponse(
+        path,
+        media_type=images.media_type(fmt),
+        # derived from a content-unique source name, so it never changes
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
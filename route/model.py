@@ -2,7 +2,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlmodel import SQLModel, Field, Column, String
+from sqlmodel import JSON, SQLModel, Field, Column, Index, String
 
 
 class Category(SQLModel, table=True):
@@ -16,12 +16,22 @@ class Category(SQLModel, table=True):
     description: Optional[str] = None
     thumbnail_url: Optional[str] = None
 
+    # maintained by the post write routes (counters.py); repair with
+    # `python counters.py recount`
+    post_count: int = Field(default=0)
+    active_post_count: int = Field(default=0)
+
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class Post(SQLModel, table=True):
     __tablename__ = "posts"
+    __table_args__ = (
+        # listings filter by category and/or status, newest first
+        Index("ix_posts_category_status_created", "category_id", "status", "created_at"),
+        Index("ix_posts_status_created", "status", "created_at"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
@@ -34,6 +44,11 @@ class Post(SQLModel, table=True):
     excerpt: Optional[str] = None
     content: Optional[str] = None
 
+    # derived from content at write time (content.py)
+    excerpt_auto: bool = Field(default=False)  # excerpt was generated, not written
+    content_html: Optional[str] = None
+    toc: Optional[list] = Field(default=None, sa_column=Column(JSON))
+
     read_time: int = Field(default=5)
     views: int = Field(default=0)
 
@@ -59,3 +74,17 @@ class Banner(SQLModel, table=True):
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MediaObject(SQLModel, table=True):
+    """Content-addressed index of files under uploads/ (one row per distinct content)."""
+    __tablename__ = "media"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sha256: str = Field(sa_column=Column(String, unique=True, index=True))
+    path: str  # relative to uploads/, e.g. "banner/3f7a…c2.png"
+    original_filename: Optional[str] = None
+    content_type: Optional[str] = None
+    size: int = 0
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,169 @@
+"""Server-rendered public pages.
+
+    GET /blog                      home: banner, most viewed, newest
+    GET /blog/category/{slug}      every active post in a category
+    GET /blog/{slug}               a single post
+
+Pages are assembled from HTML fragments (templates/partials/) that are
+rendered once and kept in `cache.fragments_cache`. Each key includes the
+`updated_at` of the rows a fragment shows, so an edited post gets a new key
+and is rendered again on its next view, and it needs no explicit
+invalidation.
+
+Responses stream: `Template.generate()` sends the page head while the
+listing is still being read, and post cards are fetched and rendered
+lazily, row by row, on the threadpool.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterator, Union
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+from sqlmodel import Session, select
+
+from cache import fragments_cache
+from database import get_read_session, read_engine
+from images import srcset
+from route.model import Banner, Category, Post
+from route.pagination import keyset_order
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.globals["srcset"] = srcset
+
+SITE_NAME = "Wow Blog"
+
+# everything a card / sidebar entry shows; never the post body
+CARD_COLUMNS = (
+    Post.id, Post.title, Post.slug, Post.cover_url, Post.excerpt,
+    Post.read_time, Post.views, Post.created_at, Post.updated_at,
+)
+
+router = APIRouter(prefix="/blog", tags=["pages"], include_in_schema=False)
+
+
+# ----------------------------------------
+# Fragments
+# ----------------------------------------
+def fragment(key, name: str, context: Union[dict, Callable[[], dict]]) -> Markup:
+    """Cached render of `name`; `context` may be a callable so misses alone pay for loading it."""
+    found, html = fragments_cache.get(key)
+    if not found:
+        html = Markup(templates.get_template(name).render(**(context() if callable(context) else context)))
+        fragments_cache.set(key, html)
+    return html
+
+
+def card(row) -> Markup:
+    return fragment(("card", row.id, row.updated_at, row.views), "partials/post_card.html", {"post": row})
+
+
+def nav(session: Session) -> Markup:
+    stmt = select(Category.id, Category.slug, Category.name, Category.updated_at).order_by(Category.name)
+    rows = session.exec(stmt).all()
+    key = ("nav", tuple((r.id, r.updated_at) for r in rows))
+    return fragment(key, "partials/nav.html", {"categories": rows})
+
+
+def hero_context(b: Banner | None) -> dict:
+    if b is None:
+        return {"heading": SITE_NAME, "buttons": []}
+    buttons = [
+        (text, url, style)
+        for text, url, style in ((b.btn1_text, b.btn1_url, ""), (b.btn2_text, b.btn2_url, " outline"))
+        if text
+    ]
+    return {"heading": b.heading or SITE_NAME, "text": b.content, "image": b.image1_url, "buttons": buttons}
+
+
+def hero(session: Session) -> Markup:
+    b = session.exec(select(Banner).limit(1)).first()
+    key = ("hero", b.id, b.updated_at) if b else ("hero", None)
+    return fragment(key, "partials/hero.html", lambda: hero_context(b))
+
+
+def stream_cards(*where, order, limit: int | None = None) -> Iterator[Markup]:
+    """Render cards while reading rows (own session: this runs after the route has returned)."""
+    stmt = select(*CARD_COLUMNS).where(Post.status == "active", *where).order_by(*order)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    with Session(read_engine) as session:
+        for row in session.exec(stmt.execution_options(yield_per=50)):
+            yield card(row)
+
+
+def latest(session: Session, *where, limit: int = 5):
+    stmt = select(*CARD_COLUMNS).where(Post.status == "active", *where).order_by(*keyset_order(Post))
+    return session.exec(stmt.limit(limit)).all()
+
+
+def render(name: str, **context) -> StreamingResponse:
+    return StreamingResponse(
+        templates.get_template(name).generate(**context),
+        media_type="text/html; charset=utf-8",
+    )
+
+
+# ----------------------------------------
+# Pages
+# ----------------------------------------
+@router.get("")
+def home(session: Session = Depends(get_read_session)):
+    return render(
+        "index.html",
+        title=SITE_NAME,
+        nav=nav(session),
+        hero=hero(session),
+        listing_title="Most viewed",
+        cards=stream_cards(order=(Post.views.desc(), Post.id.desc()), limit=6),
+        latest=latest(session),
+    )
+
+
+@router.get("/category/{slug}")
+def category_page(slug: str, session: Session = Depends(get_read_session)):
+    cat = session.exec(select(Category).where(Category.slug == slug)).first()
+    if not cat:
+        raise HTTPException(status_code=404, detail="Category not found")
+    heading = fragment(
+        ("category", cat.id, cat.updated_at),
+        "partials/hero.html",
+        {"heading": cat.name, "text": cat.description, "image": cat.thumbnail_url, "buttons": []},
+    )
+    return render(
+        "index.html",
+        title=f"{cat.name} – {SITE_NAME}",
+        nav=nav(session),
+        hero=heading,
+        listing_title=f"Posts in {cat.name}",
+        cards=stream_cards(Post.category_id == cat.id, order=keyset_order(Post)),
+        latest=latest(session),
+    )
+
+
+@router.get("/{slug}")
+def post_page(slug: str, session: Session = Depends(get_read_session)):
+    # the body is only read when the article fragment has to be rendered
+    post = session.exec(
+        select(*CARD_COLUMNS, Post.category_id).where(Post.slug == slug, Post.status == "active")
+    ).first()
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    same_category = (Post.category_id == post.category_id, Post.id != post.id)
+    return render(
+        "page.html",
+        title=f"{post.title} – {SITE_NAME}",
+        post_id=post.id,
+        nav=nav(session),
+        article=fragment(
+            ("article", post.id, post.updated_at),
+            "partials/article.html",
+            lambda: {"post": session.get(Post, post.id)},
+        ),
+        recommended=latest(session, *same_category, limit=4),
+        related=stream_cards(*same_category, order=keyset_order(Post), limit=3),
+    )
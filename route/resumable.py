@@ -0,0 +1,96 @@
+# route/resumable.py
+"""Resumable chunked uploads under /api/uploads (protocol in upload_sessions.py)."""
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Body, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+import upload_sessions
+from schema import UploadComplete, UploadCreate, UploadStatus
+from storage import CHUNK_SIZE
+
+router = APIRouter(prefix="/api/uploads", tags=["upload"])
+
+# a PUT of this many bytes is a reasonable unit to retry on a flaky connection
+SUGGESTED_CHUNK = 8 * CHUNK_SIZE
+
+
+def _status(session: upload_sessions.UploadSession) -> UploadStatus:
+    offset = session.offset()
+    return UploadStatus(
+        id=session.id,
+        bucket=session.bucket,
+        filename=session.filename,
+        size=session.size,
+        offset=offset,
+        complete=offset == session.size,
+        chunk_size=SUGGESTED_CHUNK,
+    )
+
+
+def _offset(value: Optional[str]) -> int:
+    try:
+        offset = int(value or "")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header (a byte offset) is required")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Upload-Offset must not be negative")
+    return offset
+
+
+@router.post("", response_model=UploadStatus, status_code=201)
+async def create_upload(data: UploadCreate, response: Response):
+    """Start a session; then PUT the bytes in order and POST .../complete."""
+    session = await run_in_threadpool(
+        upload_sessions.create, data.type, data.filename, data.size, data.sha256, data.content_type,
+    )
+    await run_in_threadpool(upload_sessions.maybe_gc)
+    response.headers["Location"] = f"{router.prefix}/{session.id}"
+    response.headers["Upload-Offset"] = "0"
+    return _status(session)
+
+
+@router.put("/{upload_id}", response_model=UploadStatus)
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: Optional[str] = Header(None),
+):
+    """Append the request body at Upload-Offset, which must equal the current offset (409 otherwise)."""
+    session = await run_in_threadpool(upload_sessions.load, upload_id)
+    try:
+        await upload_sessions.append(session, _offset(upload_offset), request.stream())
+    except ClientDisconnect:
+        return Response(status_code=400)  # nobody to answer; what arrived is kept
+    status = _status(session)
+    response.headers["Upload-Offset"] = str(status.offset)
+    return status
+
+
+@router.get("/{upload_id}", response_model=UploadStatus)
+async def get_upload(upload_id: str, response: Response):
+    """Where to resume: `offset` bytes have been received."""
+    session = await run_in_threadpool(upload_sessions.load, upload_id)
+    status = _status(session)
+    response.headers["Upload-Offset"] = str(status.offset)
+    response.headers["Cache-Control"] = "no-store"
+    return status
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(upload_id: str, data: Optional[UploadComplete] = Body(None)):
+    """Verify the checksum and publish the file; same response as POST /api/upload."""
+    session = await run_in_threadpool(upload_sessions.load, upload_id)
+    stored = await upload_sessions.complete(session, data.sha256 if data else None)
+    return {"url": stored.url, "bucket": stored.bucket, "filename": stored.filename}
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str):
+    session = await run_in_threadpool(upload_sessions.load, upload_id)
+    await run_in_threadpool(upload_sessions.remove, session)
+    return Response(status_code=204)
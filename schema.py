@@ -1,7 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from pydantic import computed_field
 from sqlmodel import SQLModel
 
+from images import srcset
+
 
 class CategoryRead(SQLModel):
     id: int
@@ -9,9 +12,21 @@ class CategoryRead(SQLModel):
     slug: str
     description: Optional[str]
     thumbnail_url: Optional[str]
+    post_count: int = 0
+    active_post_count: int = 0
     created_at: datetime
     updated_at: datetime
 
+    @computed_field
+    @property
+    def thumbnail_srcset(self) -> Optional[str]:
+        return srcset(self.thumbnail_url)
+
+
+class CategoryPage(SQLModel):
+    items: List[CategoryRead]
+    next_cursor: Optional[str] = None
+
 
 class PostRead(SQLModel):
     id: int
@@ -21,12 +36,51 @@ class PostRead(SQLModel):
     cover_url: Optional[str]
     status: str
     excerpt: Optional[str]
+    excerpt_auto: bool = False
     content: Optional[str]
+    content_html: Optional[str] = None
+    toc: Optional[List[dict]] = None
+    read_time: int
+    views: int
+    created_at: datetime
+    updated_at: datetime
+
+    @computed_field
+    @property
+    def cover_srcset(self) -> Optional[str]:
+        return srcset(self.cover_url)
+
+
+class PostSummary(SQLModel):
+    """PostRead without `content`; used by listing views (`view=summary`)."""
+    id: int
+    title: str
+    slug: str
+    category_id: Optional[int]
+    cover_url: Optional[str]
+    status: str
+    excerpt: Optional[str]
     read_time: int
     views: int
     created_at: datetime
     updated_at: datetime
 
+    @computed_field
+    @property
+    def cover_srcset(self) -> Optional[str]:
+        return srcset(self.cover_url)
+
+
+class PostSearchHit(PostSummary):
+    title_highlight: str
+    snippet: str
+    rank: float
+
+
+class PostPage(SQLModel):
+    items: List[PostRead]
+    next_cursor: Optional[str] = None
+
 
 class BannerRead(SQLModel):
     id: int
@@ -39,6 +93,23 @@ class BannerRead(SQLModel):
     btn2_text: Optional[str] = None
     btn2_url: Optional[str] = None
 
+    @computed_field
+    @property
+    def image1_srcset(self) -> Optional[str]:
+        return srcset(self.image1_url)
+
+    @computed_field
+    @property
+    def image2_srcset(self) -> Optional[str]:
+        return srcset(self.image2_url)
+
+
+class HomeFeed(SQLModel):
+    """GET /api/feed: everything the home page needs, in one response."""
+    banner: Optional[BannerRead] = None
+    categories: List[CategoryRead]
+    posts: List[PostSummary]
+
 
 class BannerUpdate(SQLModel):
     image1_url: Optional[str] = None
@@ -49,3 +120,66 @@ class BannerUpdate(SQLModel):
     btn1_url: Optional[str] = None
     btn2_text: Optional[str] = None
     btn2_url: Optional[str] = None
+
+
+# ---------- Bulk import (NDJSON, one object per line) ----------
+class CategoryImport(SQLModel):
+    name: str
+    slug: Optional[str] = None  # derived from name when missing
+    description: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class PostImport(SQLModel):
+    title: str
+    slug: Optional[str] = None  # derived from title when missing
+    # category_slug (as written by the export) wins over category_id, whose
+    # values differ between environments
+    category_slug: Optional[str] = None
+    category_id: Optional[int] = None
+    cover_url: Optional[str] = None
+    status: str = "active"
+    excerpt: Optional[str] = None
+    excerpt_auto: bool = False  # true: regenerate the excerpt from content
+    content: Optional[str] = None
+    # read_time, content_html and toc in an export are recomputed from content
+    views: int = 0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class ImportRowError(SQLModel):
+    line: int
+    error: str
+
+
+class ImportResult(SQLModel):
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []  # first MAX_REPORTED_ERRORS only
+
+
+class UploadCreate(SQLModel):
+    type: str = "misc"  # bucket, as for POST /api/upload
+    filename: Optional[str] = None
+    size: int  # total bytes that will be sent
+    sha256: Optional[str] = None  # hex; may instead be given on completion
+    content_type: Optional[str] = None
+
+
+class UploadStatus(SQLModel):
+    id: str
+    bucket: str
+    filename: Optional[str] = None
+    size: int
+    offset: int  # bytes received so far: the next PUT starts here
+    complete: bool
+    chunk_size: int  # suggested PUT body size
+
+
+class UploadComplete(SQLModel):
+    sha256: Optional[str] = None
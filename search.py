@@ -0,0 +1,255 @@
+"""SQLite FTS5 full-text search for posts and categories.
+
+Two external-content FTS5 tables mirror the searchable columns:
+
+- posts_fts       -> posts(title, excerpt, content)
+- categories_fts  -> categories(name, description)
+
+They are kept in sync by AFTER INSERT/UPDATE/DELETE triggers, so every write
+path (routers, scripts, manual SQL) updates the index inside the same
+transaction. `install_fts()` runs as a schema migration (migrations.py); when
+the index is first created it is rebuilt from the rows already in the
+database. `database.init_db()` then calls `detect_fts()`.
+
+If the SQLite build has no FTS5 (or the DB is not SQLite), `fts_enabled()`
+stays False and callers fall back to LIKE filtering; `search_posts()` then
+matches the whole query as a substring of title, excerpt or content, title
+matches first.
+
+Highlights and snippets are HTML: the post text is escaped and only the
+`<mark>` tags around matches are markup.
+
+Rebuild manually with:
+
+    python search.py --rebuild
+"""
+from __future__ import annotations
+
+import html
+import re
+from typing import List, Optional
+
+from sqlalchemy import column, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+_enabled = False
+
+_INDEXES = {
+    # fts table: (source table, indexed columns)
+    "posts_fts": ("posts", ("title", "excerpt", "content")),
+    "categories_fts": ("categories", ("name", "description")),
+}
+
+
+def _ddl(fts: str, table: str, cols: tuple[str, ...]) -> List[str]:
+    names = ", ".join(cols)
+    new = ", ".join(f"new.{c}" for c in cols)
+    old = ", ".join(f"old.{c}" for c in cols)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+
+def install_fts(conn: Connection) -> bool:
+    """Create FTS tables/triggers if missing; rebuild any table created now.
+
+    Runs on the caller's connection (the FTS migration in migrations.py).
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    try:
+        existing = {
+            r[0] for r in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'"
+            )
+        }
+        for fts, (table, cols) in _INDEXES.items():
+            for stmt in _ddl(fts, table, cols):
+                conn.exec_driver_sql(stmt)
+            if fts not in existing:
+                conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    except OperationalError:
+        # SQLite compiled without FTS5
+        return False
+    return True
+
+
+def detect_fts(engine: Engine) -> bool:
+    """Turn FTS queries on if the index tables exist (checked once, at startup)."""
+    global _enabled
+    if engine.dialect.name != "sqlite":
+        _enabled = False
+        return False
+    with engine.connect() as conn:
+        found = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ("
+            + ", ".join(f"'{fts}'" for fts in _INDEXES) + ")"
+        ).scalar()
+    _enabled = found == len(_INDEXES)
+    return _enabled
+
+
+def rebuild(engine: Engine) -> None:
+    """Re-index every post and category from the content tables."""
+    with engine.begin() as conn:
+        for fts in _INDEXES:
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def fts_enabled() -> bool:
+    return _enabled
+
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(q: str) -> Optional[str]:
+    """Turn free user input into a safe FTS5 query: every word, prefix-matched.
+
+    `design tips` -> `"design"* "tips"*` (implicit AND). Returns None when the
+    input has no searchable words.
+    """
+    words = _TOKEN.findall(q or "")
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def matching_ids(fts: str, q: str):
+    """`SELECT rowid FROM <fts> WHERE MATCH` usable in `Model.id.in_(...)`, or None."""
+    query = match_query(q)
+    if not _enabled or query is None:
+        return None
+    return (
+        text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :fts_q")
+        .bindparams(fts_q=query)
+        .columns(column("rowid"))
+    )
+
+
+# FTS5 wraps matches in these; the text is escaped, then they become <mark> tags
+_OPEN, _CLOSE = "\x02", "\x03"
+_HIT_COLUMNS = """p.id, p.title, p.slug, p.category_id, p.cover_url, p.status,
+               p.excerpt, p.read_time, p.views, p.created_at, p.updated_at"""
+SNIPPET_CHARS = 120
+
+
+def _marked(fragment: Optional[str]) -> str:
+    """Escape `fragment` as HTML, turning the match markers into <mark> tags."""
+    return html.escape(fragment or "", quote=False).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _filters(status: Optional[str], category_id: Optional[int], params: dict) -> str:
+    sql = ""
+    if status is not None:
+        sql += " AND p.status = :status"
+        params["status"] = status
+    if category_id is not None:
+        sql += " AND p.category_id = :category_id"
+        params["category_id"] = category_id
+    return sql
+
+
+def search_posts(
+    session: Session,
+    q: str,
+    *,
+    limit: int = 20,
+    status: Optional[str] = None,
+    category_id: Optional[int] = None,
+) -> list:
+    """bm25-ranked post hits with highlighted title and a content snippet.
+
+    Title matches weigh most, then excerpt, then body.
+    """
+    query = match_query(q)
+    if query is None:
+        return []
+    if not _enabled:
+        return _like_search(session, q.strip(), limit, status, category_id)
+    sql = f"""
+        SELECT {_HIT_COLUMNS},
+               highlight(posts_fts, 0, '{_OPEN}', '{_CLOSE}') AS title_highlight,
+               snippet(posts_fts, -1, '{_OPEN}', '{_CLOSE}', '…', 16) AS snippet,
+               bm25(posts_fts, 10.0, 4.0, 1.0) AS rank
+        FROM posts_fts
+        JOIN posts p ON p.id = posts_fts.rowid
+        WHERE posts_fts MATCH :q
+    """
+    params = {"q": query, "limit": limit}
+    sql += _filters(status, category_id, params)
+    sql += " ORDER BY rank LIMIT :limit"
+    rows = session.connection().execute(text(sql), params).mappings().all()
+    return [
+        {**row, "title_highlight": _marked(row["title_highlight"]), "snippet": _marked(row["snippet"])}
+        for row in rows
+    ]
+
+
+def _highlight(value: Optional[str], needle: re.Pattern) -> str:
+    return _marked(needle.sub(lambda m: f"{_OPEN}{m.group(0)}{_CLOSE}", value or ""))
+
+
+def _snippet(row, needle: re.Pattern) -> str:
+    for value in (row["content"], row["excerpt"], row["title"]):
+        match = needle.search(value or "")
+        if match:
+            start = max(0, match.start() - SNIPPET_CHARS // 2)
+            window = value[start:start + SNIPPET_CHARS]
+            prefix = "…" if start else ""
+            suffix = "…" if start + SNIPPET_CHARS < len(value) else ""
+            return prefix + _highlight(window, needle) + suffix
+    return ""
+
+
+def _like_search(session: Session, q: str, limit: int, status: Optional[str], category_id: Optional[int]) -> list:
+    """Substring search without FTS5: title matches first, then newest."""
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", q.lower()) + "%"
+    in_title = "lower(p.title) LIKE :like ESCAPE '\\'"
+    sql = f"""
+        SELECT {_HIT_COLUMNS}, p.content,
+               CASE WHEN {in_title} THEN 0.0 ELSE 1.0 END AS rank
+        FROM posts p
+        WHERE ({in_title}
+               OR lower(p.excerpt) LIKE :like ESCAPE '\\'
+               OR lower(p.content) LIKE :like ESCAPE '\\')
+    """
+    params = {"like": pattern, "limit": limit}
+    sql += _filters(status, category_id, params)
+    sql += " ORDER BY rank, p.created_at DESC, p.id DESC LIMIT :limit"
+    needle = re.compile(re.escape(q), re.IGNORECASE)
+    hits = []
+    for row in session.connection().execute(text(sql), params).mappings():
+        hit = {k: v for k, v in row.items() if k != "content"}
+        hit["title_highlight"] = _highlight(row["title"], needle)
+        hit["snippet"] = _snippet(row, needle)
+        hits.append(hit)
+    return hits
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine, init_db
+
+    parser = argparse.ArgumentParser(description="Manage the FTS5 search index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index all rows")
+    args = parser.parse_args()
+
+    init_db()
+    if not detect_fts(engine):
+        raise SystemExit("FTS5 is not available for this database")
+    if args.rebuild:
+        rebuild(engine)
+        print("Search index rebuilt")
@@ -0,0 +1,474 @@
+"""Upload storage shared by every upload endpoint.
+
+`save_upload()` streams an `UploadFile` to disk in fixed-size chunks:
+
+- chunks are written to a temp file from the threadpool, never on the loop
+- the size limit and allowed MIME types are enforced while streaming
+  (both the declared content type and the file's magic bytes must be
+  allowed for the bucket); the stored extension comes from the sniffed
+  type, never from the client's filename, since /uploads serves files with
+  the Content-Type their extension implies
+- a SHA-256 of the content is computed on the way through
+- the temp file is fsynced and atomically renamed into uploads/<bucket>/
+
+Starlette spools a whole multipart body to disk before the endpoint runs, so
+`UploadLimitMiddleware` rejects multipart requests larger than
+MAX_UPLOAD_BYTES (plus MULTIPART_FIELDS_BYTES for the other form fields) up
+front: from Content-Length when there is one, otherwise as soon as more
+than that has arrived.
+
+`store_file()` publishes a file that was written to TMP_DIR some other way
+(resumable uploads, see upload_sessions.py) through the same steps.
+
+Storage is content-addressed: new files are published as
+/uploads/<bucket>/<sha256 prefix><ext>, and the `media` table maps each hash
+to its canonical path and original filename. Uploading bytes that are already
+stored writes nothing; the existing URL is returned.
+
+Collapse the duplicates that predate the index (rewrites DB references,
+then deletes the extra copies):
+
+    python storage.py dedupe --dry-run
+    python storage.py dedupe
+
+Environment:
+- MAX_UPLOAD_BYTES  -> per-file size limit (default 20 MiB)
+- MULTIPART_FIELDS_BYTES -> room for the non-file fields of a multipart
+                       request, on top of MAX_UPLOAD_BYTES (default 1 MiB)
+- UPLOAD_TMP_DIR    -> where partial uploads live; must be on the same
+                       filesystem as uploads/ for the rename to be atomic
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import images
+from database import async_engine
+from route.model import MediaObject
+from static_files import PRECOMPRESSED_SUFFIXES, precompress
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+UPLOADS_DIR = BASE_DIR / "uploads"
+TMP_DIR = Path(os.getenv("UPLOAD_TMP_DIR") or BASE_DIR / ".uploads-tmp")
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES") or 20 * 1024 * 1024)
+MULTIPART_FIELDS_BYTES = int(os.getenv("MULTIPART_FIELDS_BYTES") or 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+# Friendly type names (as sent by the admin UI) -> subdirectory of uploads/
+BUCKETS = {
+    "banner": "banner",
+    "banners": "banner",
+    "category": "categories",
+    "categories": "categories",
+    "post": "posts",
+    "posts": "posts",
+    "profile": "profile",
+    "avatar": "profile",
+    "misc": "misc",
+}
+
+# SVG is not accepted: it can carry script and would run on our origin
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/avif"}
+ALLOWED_TYPES = {
+    "banner": IMAGE_TYPES,
+    "categories": IMAGE_TYPES,
+    "posts": IMAGE_TYPES,
+    "profile": IMAGE_TYPES,
+    "misc": IMAGE_TYPES | {"application/pdf", "text/plain", "video/mp4", "audio/mpeg"},
+}
+# Sniffed type -> extension of the stored file
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "application/pdf": ".pdf",
+    "text/plain": ".txt",
+    "video/mp4": ".mp4",
+    "audio/mpeg": ".mp3",
+}
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    url: str
+    bucket: str
+    filename: str
+    path: Path
+    size: int
+    sha256: str
+    content_type: str
+    deduplicated: bool = False
+
+
+def resolve_bucket(type: Optional[str]) -> str:
+    return BUCKETS.get((type or "").lower().strip(), "misc")
+
+
+def safe_filename(name: Optional[str]) -> str:
+    orig = name or "file"
+    safe = "".join(ch if ch.isalnum() or ch in (".", "_", "-", " ") else "_" for ch in orig).strip()
+    return safe.replace(" ", "_") or "file"
+
+
+def stamped_name(name: Optional[str]) -> str:
+    return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{safe_filename(name)}"
+
+
+def hashed_name(sha256: str, content_type: str) -> str:
+    return f"{sha256[:32]}{EXTENSIONS[content_type]}"
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """Content type from the first bytes of a file, for the types we accept."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if text.startswith((b"<svg", b"<?xml")) and b"<svg" in head:
+        return "image/svg+xml"
+    try:
+        head[:-3].decode("utf-8")  # the last bytes may be a split multi-byte char
+        return "text/plain"
+    except UnicodeDecodeError:
+        return None
+
+
+def check_type(declared: Optional[str], head: bytes, bucket: str) -> str:
+    allowed = ALLOWED_TYPES[bucket]
+    sniffed = sniff_type(head)
+    declared = (declared or "").split(";")[0].strip().lower()
+    if declared in ("", "application/octet-stream"):
+        declared = sniffed
+    if sniffed not in allowed or declared not in allowed:
+        raise HTTPException(status_code=415, detail="Unsupported file type")
+    return sniffed
+
+
+def _write(out: BinaryIO, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _finish(out: BinaryIO) -> None:
+    out.flush()
+    out.close()
+
+
+def _publish(tmp: Path, dest: Path) -> None:
+    fd = os.open(tmp, os.O_RDONLY)  # contents on disk before the rename makes them visible
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, dest)
+    # persist the rename itself
+    dir_fd = os.open(dest.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+async def _find(sha256: str) -> Optional[MediaObject]:
+    async with AsyncSession(async_engine) as session:
+        media = (await session.exec(select(MediaObject).where(MediaObject.sha256 == sha256))).first()
+    if media and (UPLOADS_DIR / media.path).is_file():
+        return media
+    return None
+
+
+async def _record(media: MediaObject) -> MediaObject:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        stale = (await session.exec(select(MediaObject).where(MediaObject.sha256 == media.sha256))).first()
+        if stale:  # indexed, but the file was removed from disk
+            await session.delete(stale)
+            await session.flush()
+        session.add(media)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # a concurrent upload of the same bytes got there first
+            await session.rollback()
+            return await _find(media.sha256) or media
+    return media
+
+
+def _stored(media: MediaObject, deduplicated: bool) -> StoredFile:
+    bucket, _, filename = media.path.partition("/")
+    return StoredFile(
+        url=f"/uploads/{media.path}",
+        bucket=bucket,
+        filename=filename,
+        path=UPLOADS_DIR / media.path,
+        size=media.size,
+        sha256=media.sha256,
+        content_type=media.content_type or "",
+        deduplicated=deduplicated,
+    )
+
+
+def _open_temp() -> tuple[BinaryIO, Path]:
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=TMP_DIR, prefix="upload-")
+    return os.fdopen(fd, "wb"), Path(name)
+
+
+async def save_upload(file: UploadFile, bucket: str, *, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """Stream `file` into uploads/<bucket>/ and return where it landed.
+
+    If identical bytes were stored before (in any bucket), the temp copy is
+    dropped and the existing file is returned with `deduplicated=True`.
+
+    Raises 400 (empty), 413 (too large) or 415 (type not allowed for bucket).
+    """
+    bucket = resolve_bucket(bucket)
+    out, tmp = await run_in_threadpool(_open_temp)
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            if content_type is None:
+                content_type = check_type(file.content_type, chunk, bucket)
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail="File too large")
+            await run_in_threadpool(_write, out, digest, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+
+        sha256 = digest.hexdigest()
+        await run_in_threadpool(_finish, out)
+    except BaseException:
+        out.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    return await store_file(tmp, bucket, file.filename, sha256=sha256, size=size, content_type=content_type)
+
+
+async def store_file(
+    tmp: Path, bucket: str, filename: Optional[str], *, sha256: str, size: int, content_type: str,
+) -> StoredFile:
+    """Publish the complete file `tmp` (under TMP_DIR) as uploads/<bucket>/<hash><ext>.
+
+    If identical bytes were stored before, `tmp` is deleted and the existing
+    file is returned with `deduplicated=True`. Either way `tmp` is gone
+    afterwards, including when this raises.
+    """
+    try:
+        existing = await _find(sha256)
+        if existing:
+            await run_in_threadpool(tmp.unlink, True)
+            return _stored(existing, deduplicated=True)
+
+        rel = f"{bucket}/{hashed_name(sha256, content_type)}"
+        await run_in_threadpool(_publish, tmp, UPLOADS_DIR / rel)
+        await run_in_threadpool(precompress, UPLOADS_DIR / rel)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    media = await _record(MediaObject(
+        sha256=sha256,
+        path=rel,
+        original_filename=filename,
+        content_type=content_type,
+        size=size,
+    ))
+    images.schedule(f"/uploads/{media.path}")  # resized variants, off the request path
+    return _stored(media, deduplicated=False)
+
+
+# ----------------------------------------
+# Request size limit
+# ----------------------------------------
+_TOO_LARGE_BODY = json.dumps({"detail": "File too large"}).encode()
+
+
+class UploadLimitMiddleware:
+    """Pure ASGI: 413 for multipart bodies over the limit, before Starlette spools them."""
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES + MULTIPART_FIELDS_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_bytes:
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_TOO_LARGE_BODY)).encode()),
+                    (b"connection", b"close"),
+                ],
+            })
+            return await send({"type": "http.response.body", "body": _TOO_LARGE_BODY})
+
+        received = 0
+
+        async def limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:  # no (or a false) Content-Length
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+
+        await self.app(scope, limited, send)
+
+
+# ----------------------------------------
+# One-off migration: collapse existing duplicates
+# ----------------------------------------
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        while chunk := fh.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedupe(dry_run: bool = False) -> dict:
+    """Index every file under uploads/ and delete byte-identical copies.
+
+    For each group of identical files the indexed path (or, failing that, the
+    oldest timestamped name) is kept. DB references to a copy's URL (covers,
+    thumbnails, banner images, URLs inside post content) are rewritten to the
+    kept file and committed before any copy is deleted. Rewritten rows get a
+    new `updated_at`, and rewritten posts a re-rendered `content_html`, so
+    ETags, page fragments and the static export pick the change up.
+
+    Returns counts and `duplicates`, a list of {"path", "same_as"}.
+    """
+    from sqlalchemy import update
+    from sqlmodel import Session, col
+
+    import content
+    from cache import invalidate_all
+    from database import engine, init_db
+    from route.model import Banner, Category, Post
+
+    init_db()
+    groups: dict[str, list[str]] = {}
+    for path in sorted(UPLOADS_DIR.glob("*/*")):
+        if (
+            path.is_file()
+            and not path.name.startswith(".")
+            and not path.parent.name.startswith((".", "_"))
+            and path.suffix not in PRECOMPRESSED_SUFFIXES
+        ):
+            groups.setdefault(_hash_file(path), []).append(path.relative_to(UPLOADS_DIR).as_posix())
+
+    url_columns = [Post.cover_url, Category.thumbnail_url, Banner.image1_url, Banner.image2_url]
+    stats = {"files": sum(map(len, groups.values())), "unique": len(groups), "removed": 0, "bytes_freed": 0,
+             "duplicates": []}
+    doomed: list[Path] = []
+    with Session(engine) as session:
+        indexed = {m.sha256: m for m in session.exec(select(MediaObject))}
+        for sha256, paths in groups.items():
+            media = indexed.get(sha256)
+            keep = media.path if media and media.path in paths else paths[0]
+            if media is None:
+                media = MediaObject(
+                    sha256=sha256,
+                    original_filename=keep.partition("/")[2].split("_", 1)[-1],
+                    size=(UPLOADS_DIR / keep).stat().st_size,
+                )
+            media.path = keep
+            session.add(media)
+
+            new_url = f"/uploads/{keep}"
+            for dup in paths:
+                if dup == keep:
+                    continue
+                old_url = f"/uploads/{dup}"
+                stats["duplicates"].append({"path": dup, "same_as": keep})
+                stats["removed"] += 1
+                stats["bytes_freed"] += (UPLOADS_DIR / dup).stat().st_size
+                doomed.append(UPLOADS_DIR / dup)
+                now = datetime.utcnow()
+                for column in url_columns:
+                    session.exec(
+                        update(column.class_)
+                        .where(column == old_url)
+                        .values({column.key: new_url, "updated_at": now})
+                    )
+                for post in session.exec(select(Post).where(col(Post.content).contains(old_url))):
+                    post.content = post.content.replace(old_url, new_url)
+                    content.apply(post)
+                    post.updated_at = now
+                    session.add(post)
+        if dry_run:
+            session.rollback()
+            return stats
+        session.commit()
+    invalidate_all()  # running workers may have cached the old URLs
+
+    for path in doomed:
+        path.unlink(missing_ok=True)
+    log.info("dedupe removed %d duplicate(s), %d bytes", stats["removed"], stats["bytes_freed"])
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Media store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("dedupe", help="index uploads/ and remove byte-identical copies")
+    cmd.add_argument("--dry-run", action="store_true", help="report only; change nothing")
+    args = parser.parse_args()
+
+    if args.command == "dedupe":
+        result = dedupe(dry_run=args.dry_run)
+        for dup in result["duplicates"]:
+            print(f"{'would remove' if args.dry_run else 'remove'} {dup['path']} (same as {dup['same_as']})")
+        print(
+            f"{result['files']} files, {result['unique']} unique, "
+            f"{result['removed']} duplicates {'found' if args.dry_run else 'removed'}, "
+            f"{result['bytes_freed']} bytes"
+        )
@@ -0,0 +1,322 @@
+"""Resumable uploads: a large file sent in chunks, each of which can be retried.
+
+With a single multipart POST /api/upload, a connection that drops at 90%
+means starting over. route/resumable.py instead exposes:
+
+    POST   /api/uploads                {type, filename, size, sha256?, content_type?}
+                                       -> 201 {id, offset: 0, ...}
+    PUT    /api/uploads/{id}           body: the next bytes, with header
+                                       Upload-Offset: <where they start>
+                                       -> {offset}
+    GET    /api/uploads/{id}           -> {offset, ...}   (resume from here)
+    POST   /api/uploads/{id}/complete  {sha256?} -> {url, bucket, filename},
+                                       like POST /api/upload
+    DELETE /api/uploads/{id}           abort
+
+A session is two files in UPLOAD_TMP_DIR/sessions/: `<id>.json` with what
+was declared at creation, and `<id>.part` with the bytes received so far.
+The size of the .part file is the offset, so any worker can serve any
+request of a session. A PUT appends its body in CHUNK_SIZE writes and
+holds at most one of them in memory. It takes an exclusive flock on the
+.part file, so a retried chunk racing its original gets 409 instead of
+interleaving. If the connection drops mid-chunk, the bytes already
+received are kept, and GET tells the client where to resume.
+
+Completing a session checks the SHA-256 of the whole file against the one
+the client declared, at creation or on completion, and checks its type
+against the bucket the same way storage.py does. It then hands the .part
+file to `storage.store_file()`, which gives the same bucket layout,
+content-addressed names, dedupe and image variants as a one-shot upload.
+
+Sessions idle for longer than UPLOAD_SESSION_TTL are deleted. Each worker
+sweeps at most once every UPLOAD_GC_INTERVAL when sessions are created, or
+run it from cron:
+
+    python upload_sessions.py gc
+
+Environment:
+- UPLOAD_SESSION_TTL  -> seconds an unfinished session may sit idle (default 86400)
+- UPLOAD_GC_INTERVAL  -> minimum seconds between a worker's sweeps (default 3600)
+(MAX_UPLOAD_BYTES and UPLOAD_TMP_DIR as in storage.py)
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from storage import CHUNK_SIZE, MAX_UPLOAD_BYTES, TMP_DIR, StoredFile, check_type, resolve_bucket, store_file
+
+SESSIONS_DIR = TMP_DIR / "sessions"
+SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL") or 24 * 3600)
+GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL") or 3600)
+
+_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+HEAD_BYTES = 4096  # what the type check looks at
+
+
+@dataclass
+class UploadSession:
+    id: str
+    bucket: str
+    filename: Optional[str]
+    size: int
+    sha256: Optional[str]
+    content_type: Optional[str]  # as declared by the client
+    created_at: str
+
+    @property
+    def meta_path(self) -> Path:
+        return SESSIONS_DIR / f"{self.id}.json"
+
+    @property
+    def part_path(self) -> Path:
+        return SESSIONS_DIR / f"{self.id}.part"
+
+    def offset(self) -> int:
+        try:
+            return self.part_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+
+def _checksum(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if not _SHA256.match(value):
+        raise HTTPException(status_code=400, detail="sha256 must be 64 hex digits")
+    return value
+
+
+# ----------------------------------------
+# Sessions
+# ----------------------------------------
+def create(
+    type: Optional[str], filename: Optional[str], size: int,
+    sha256: Optional[str] = None, content_type: Optional[str] = None,
+) -> UploadSession:
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    session = UploadSession(
+        id=secrets.token_urlsafe(18),
+        bucket=resolve_bucket(type),
+        filename=filename,
+        size=size,
+        sha256=_checksum(sha256),
+        content_type=content_type,
+        created_at=datetime.utcnow().isoformat(),
+    )
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    session.part_path.touch()
+    tmp = session.meta_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(asdict(session)))
+    os.replace(tmp, session.meta_path)
+    return session
+
+
+def load(session_id: str) -> UploadSession:
+    if not _ID.match(session_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        data = json.loads((SESSIONS_DIR / f"{session_id}.json").read_text())
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return UploadSession(**data)
+
+
+def remove(session: UploadSession) -> None:
+    session.part_path.unlink(missing_ok=True)
+    session.meta_path.unlink(missing_ok=True)
+
+
+def _open_locked(session: UploadSession, mode: str) -> BinaryIO:
+    try:
+        fh = session.part_path.open(mode)
+    except FileNotFoundError:  # completed, aborted or collected meanwhile
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fh.close()
+        raise HTTPException(status_code=409, detail="Another request for this upload is in progress")
+    return fh
+
+
+@asynccontextmanager
+async def _locked(session: UploadSession, mode: str = "ab") -> AsyncIterator[BinaryIO]:
+    fh = await run_in_threadpool(_open_locked, session, mode)
+    try:
+        yield fh
+    finally:
+        fh.close()  # also releases the lock; not awaited, so it happens even when cancelled
+
+
+# ----------------------------------------
+# Chunks
+# ----------------------------------------
+def _append(fh: BinaryIO, data: bytes) -> None:
+    fh.write(data)
+    fh.flush()
+
+
+def _touch(session: UploadSession) -> None:
+    try:
+        os.utime(session.meta_path)  # activity, for the GC
+    except FileNotFoundError:  # aborted meanwhile
+        pass
+
+
+async def append(session: UploadSession, offset: int, body: AsyncIterator[bytes]) -> int:
+    """Append `body` at `offset` (which must be the current offset); returns the new offset."""
+    async with _locked(session) as fh:
+        current = fh.seek(0, os.SEEK_END)
+        if offset != current:
+            raise HTTPException(
+                status_code=409, detail=f"Upload-Offset is {offset}, expected {current}",
+                headers={"Upload-Offset": str(current)},
+            )
+        buf = bytearray()
+        written = current
+        checked = current > 0
+        try:
+            async for data in body:
+                if written + len(buf) + len(data) > session.size:
+                    raise HTTPException(status_code=413, detail="Chunk runs past the declared size")
+                buf += data
+                if not checked and len(buf) >= min(HEAD_BYTES, session.size):
+                    checked = True
+                    try:  # fail early rather than after the whole file
+                        check_type(session.content_type, bytes(buf[:HEAD_BYTES]), session.bucket)
+                    except HTTPException:
+                        buf.clear()
+                        await run_in_threadpool(remove, session)
+                        raise
+                if len(buf) >= CHUNK_SIZE:
+                    await run_in_threadpool(_append, fh, bytes(buf))
+                    written += len(buf)
+                    buf.clear()
+        finally:
+            # what did arrive is kept (also when the client went away): resume after it
+            if buf:
+                await run_in_threadpool(_append, fh, bytes(buf))
+                written += len(buf)
+        await run_in_threadpool(_touch, session)
+        return written
+
+
+# ----------------------------------------
+# Completion
+# ----------------------------------------
+def _verify(fh: BinaryIO) -> tuple[str, bytes]:
+    fh.seek(0)
+    digest = hashlib.sha256()
+    head = b""
+    while chunk := fh.read(CHUNK_SIZE):
+        if not head:
+            head = chunk[:HEAD_BYTES]
+        digest.update(chunk)
+    os.fsync(fh.fileno())
+    return digest.hexdigest(), head
+
+
+async def complete(session: UploadSession, sha256: Optional[str] = None) -> StoredFile:
+    expected = _checksum(sha256) or session.sha256
+    if expected is None:
+        raise HTTPException(status_code=400, detail="sha256 is required (at creation or completion)")
+    async with _locked(session, "rb") as fh:
+        offset = fh.seek(0, os.SEEK_END)
+        if offset != session.size:
+            raise HTTPException(
+                status_code=409, detail=f"Upload incomplete: {offset} of {session.size} bytes",
+                headers={"Upload-Offset": str(offset)},
+            )
+        actual, head = await run_in_threadpool(_verify, fh)
+        if actual != expected:
+            await run_in_threadpool(remove, session)  # appending can't repair it
+            raise HTTPException(status_code=422, detail="Checksum mismatch; upload discarded")
+        try:
+            content_type = check_type(session.content_type, head, session.bucket)
+        except HTTPException:
+            await run_in_threadpool(remove, session)
+            raise
+        await run_in_threadpool(session.meta_path.unlink, True)
+        # store_file moves (or deletes) the .part file
+        return await store_file(
+            session.part_path, session.bucket, session.filename,
+            sha256=actual, size=offset, content_type=content_type,
+        )
+
+
+# ----------------------------------------
+# Garbage collection
+# ----------------------------------------
+def gc(ttl: float = SESSION_TTL) -> int:
+    """Delete sessions idle for more than `ttl` seconds; returns how many."""
+    if not SESSIONS_DIR.is_dir():
+        return 0
+    cutoff = time.time() - ttl
+    removed = 0
+    for path in SESSIONS_DIR.iterdir():
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if path.suffix == ".part":
+                meta = path.with_suffix(".json")
+                if meta.exists() and meta.stat().st_mtime >= cutoff:
+                    continue  # still in use: meta mtime is the last activity
+                with path.open("rb") as fh:
+                    try:
+                        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # a chunk is being written right now
+                    path.unlink()
+                meta.unlink(missing_ok=True)
+                removed += 1
+            elif path.suffix == ".json" and not path.with_suffix(".part").exists():
+                path.unlink()  # metadata left over without data
+            elif path.name.endswith(".json.tmp"):
+                path.unlink()
+        except FileNotFoundError:
+            continue  # completed or removed meanwhile
+    return removed
+
+
+_last_gc = 0.0
+
+
+def maybe_gc() -> None:
+    """`gc()`, if this worker hasn't run it in the last GC_INTERVAL seconds."""
+    global _last_gc
+    now = time.monotonic()
+    if _last_gc and now - _last_gc < GC_INTERVAL:
+        return
+    _last_gc = now
+    gc()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resumable upload sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("gc", help="delete sessions idle for longer than UPLOAD_SESSION_TTL")
+    p.add_argument("--ttl", type=float, default=SESSION_TTL, help="seconds (default %(default)s)")
+    args = parser.parse_args()
+
+    print(f"{gc(args.ttl)} stale upload session(s) removed")
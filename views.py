@@ -0,0 +1,162 @@
+"""Buffered view counting for `Post.views`.
+
+A page view must not become a SQLite write: every commit takes the database
+write lock, so one UPDATE per view would serialize readers behind each
+other. Instead `record()` only bumps an in-memory counter per post id, and
+a background task flushes all pending counts in a single transaction:
+
+    UPDATE posts SET views = views + :n WHERE id = :id    -- executemany
+
+Flushes happen every VIEWS_FLUSH_INTERVAL seconds, as soon as
+VIEWS_MAX_PENDING views are waiting (this bounds how many a crash can lose),
+and on shutdown.
+
+Optionally, repeat views of the same post by the same visitor (client
+address + User-Agent) within VIEWS_DEDUPE_SECONDS are counted once.
+
+Counts are eventually consistent. A flush doesn't touch `updated_at`
+(Last-Modified stays the time of the last edit) and is not a cache
+invalidation: with views flushing every few seconds that would empty every
+worker's posts cache (cache.py) all the time. It only drops this worker's
+cached GET /api/posts/{id} bodies for the flushed posts, whose ETags include
+the view count (conditional.py), so those show new counts after one flush
+interval. Everything else (other workers' copies, listings, search, the
+feed, server-rendered fragments) may show counts up to CACHE_TTL old.
+
+Environment:
+- VIEWS_FLUSH_INTERVAL  -> seconds between flushes (default 5)
+- VIEWS_MAX_PENDING     -> flush early once this many views are buffered (1000)
+- VIEWS_DEDUPE_SECONDS  -> per-visitor dedupe window; 0 disables (default 0)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from cache import posts_cache
+from database import engine
+
+log = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("VIEWS_FLUSH_INTERVAL") or 5)
+MAX_PENDING = int(os.getenv("VIEWS_MAX_PENDING") or 1000)
+DEDUPE_SECONDS = float(os.getenv("VIEWS_DEDUPE_SECONDS") or 0)
+
+_UPDATE = text("UPDATE posts SET views = views + :n WHERE id = :id")
+
+
+def visitor_key(host: Optional[str], user_agent: Optional[str]) -> str:
+    return hashlib.blake2b(f"{host}|{user_agent}".encode(), digest_size=8).hexdigest()
+
+
+class ViewBuffer:
+    def __init__(
+        self,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+        dedupe_seconds: float = DEDUPE_SECONDS,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dedupe_seconds = dedupe_seconds
+        self._counts: Counter[int] = Counter()
+        self._pending = 0
+        self._seen: Dict[Tuple[int, str], float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = self.deduplicated = self.flushed = self.flushes = 0
+
+    def record(self, post_id: int, visitor: Optional[str] = None) -> bool:
+        """Count one view; False if it was a repeat within the dedupe window."""
+        now = time.monotonic()
+        with self._lock:
+            if self.dedupe_seconds and visitor is not None:
+                key = (post_id, visitor)
+                if self._seen.get(key, 0.0) > now:
+                    self.deduplicated += 1
+                    return False
+                self._seen[key] = now + self.dedupe_seconds
+            self._counts[post_id] += 1
+            self._pending += 1
+            self.recorded += 1
+            full = self._pending >= self.max_pending
+        wake, loop = self._wake, self._loop
+        if full and wake is not None and loop is not None:
+            loop.call_soon_threadsafe(wake.set)
+        return True
+
+    def flush(self) -> int:
+        """Write all buffered counts in one transaction; returns views written."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts, self._pending = self._counts, Counter(), 0
+                now = time.monotonic()
+                self._seen = {k: until for k, until in self._seen.items() if until > now}
+            if not counts:
+                return 0
+            try:
+                with engine.begin() as conn:
+                    conn.execute(_UPDATE, [{"id": pid, "n": n} for pid, n in counts.items()])
+            except Exception:
+                with self._lock:  # keep them for the next attempt
+                    self._counts.update(counts)
+                    self._pending += sum(counts.values())
+                raise
+            posts_cache.forget(("get", pid) for pid in counts)
+            written = sum(counts.values())
+            self.flushed += written
+            self.flushes += 1
+            return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                log.exception("flushing view counts failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = self._wake = self._loop = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            "pending": pending,
+            "recorded": self.recorded,
+            "deduplicated": self.deduplicated,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+        }
+
+
+buffer = ViewBuffer()